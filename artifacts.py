@@ -0,0 +1,103 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import wave
+
+
+def content_key(*parts):
+    """Returns a sha256 content hash of the given strings."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def source_key(url, response_headers):
+    """Identifies a download by URL and validators, or returns None if the server sent none."""
+    etag = response_headers.get('ETag')
+    last_modified = response_headers.get('Last-Modified')
+    if not etag and not last_modified:
+        return None
+    return content_key(url, etag, last_modified, response_headers.get('Content-Length'))
+
+
+def hash_wav(wav_path, frames_per_read=1 << 20):
+    """Returns the sha256 of a wav file's PCM data."""
+    digest = hashlib.sha256()
+    with wave.open(wav_path, 'rb') as wf:
+        while True:
+            pcm = wf.readframes(frames_per_read)
+            if not pcm:
+                break
+            digest.update(pcm)
+    return digest.hexdigest()
+
+
+def hash_pcm(pcm_path, bytes_per_read=1 << 21):
+    """Returns the sha256 of a raw PCM file, the same digest hash_wav gives for the same samples."""
+    digest = hashlib.sha256()
+    with open(pcm_path, 'rb') as f:
+        while True:
+            pcm = f.read(bytes_per_read)
+            if not pcm:
+                break
+            digest.update(pcm)
+    return digest.hexdigest()
+
+
+class HashingStream(object):
+    """Passes PCM blocks through while hashing them; hexdigest is valid once the stream is exhausted."""
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.digest = hashlib.sha256()
+        self.finished = False
+
+    def __iter__(self):
+        for block in self.blocks:
+            self.digest.update(block)
+            yield block
+        self.finished = True
+
+    def hexdigest(self):
+        return self.digest.hexdigest() if self.finished else None
+
+
+class ArtifactStore(object):
+    """Stage outputs stored as JSON under a content hash of their input.
+
+    Stages used by the pipeline:
+        source - download identity -> hash of its decoded PCM
+        vad - PCM hash and VAD settings -> [start, end, timestamp] segment ranges
+        transcript - VAD key and STT model -> [timestamp, sentence] pairs
+        summary - summarizer input and settings -> summary text
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, stage, key):
+        return os.path.join(self.root, stage, key[:2], key + '.json')
+
+    def get(self, stage, key):
+        if key is None:
+            return None
+        try:
+            with open(self._path(stage, key), 'r') as f:
+                return json.load(f)
+        except IOError:
+            return None
+        except ValueError:
+            logging.warning('Ignoring corrupt %s artifact %s' % (stage, key))
+            return None
+
+    def put(self, stage, key, value):
+        path = self._path(stage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        with open(tmp_path, 'w') as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,85 @@
+"""Compares single-stream and parallel ranged downloads against a local stand-in CDN.
+
+The server answers HEAD and byte-range GETs for one in-memory file and
+throttles every connection to --rate bytes/sec, like a slow CDN edge. Each
+download is checked byte for byte against the served file.
+
+Usage: python benchmarks/bench_download.py [--megabytes N] [--rate BYTES] [--connections N ...]
+"""
+import argparse
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import downloader  # noqa: E402
+
+
+def make_handler(body, rate, chunk_size=16384):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _headers(self, status, start, end):
+            self.send_response(status)
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', '"bench"')
+            self.send_header('Content-Length', str(end - start))
+            if status == 206:
+                self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end - 1, len(body)))
+            self.end_headers()
+
+        def _range(self):
+            match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+            if match is None or self.headers.get('If-Range', '"bench"') != '"bench"':
+                return 200, 0, len(body)
+            end = int(match.group(2)) + 1 if match.group(2) else len(body)
+            return 206, int(match.group(1)), min(end, len(body))
+
+        def do_HEAD(self):
+            self._headers(200, 0, len(body))
+
+        def do_GET(self):
+            status, start, end = self._range()
+            self._headers(status, start, end)
+            for offset in range(start, end, chunk_size):
+                self.wfile.write(body[offset:min(offset + chunk_size, end)])
+                time.sleep(chunk_size / rate)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--megabytes', type=float, default=16)
+    parser.add_argument('--rate', type=int, default=4 * 1024 * 1024, help='bytes/sec per connection')
+    parser.add_argument('--connections', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    body = os.urandom(int(args.megabytes * 1024 * 1024))
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(body, args.rate))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:%d/episode.mp3' % server.server_port
+
+    for connections in args.connections:
+        fetcher = downloader.Downloader(connections, 0, max(connections, 1), 32768)
+        download = fetcher.get(url)
+        received = b''.join(bytes(chunk) for chunk in download.iter_content(32768))
+        assert received == body, 'downloaded bytes differ from the served file'
+
+        stats = download.stats()
+        print('%-7s %2d ranges  %9d bytes in %6.2fs  %8.2f MB/s' % (
+            stats['mode'], stats['ranges'], stats['bytes'], stats['seconds'], stats['bytes_per_second'] / 2 ** 20))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""Microbenchmarks NgramMultiheadAttention and NgramTransformerDecoder with random weights.
+
+Times a full-sequence forward against step-by-step incremental decoding, for
+one attention module and for the whole decoder's extract_features. Also breaks
+out the sub-steps of the attention: relative logits, mask and bucket
+building, and the cat/einsum of the ngram streams. Reports time and peak
+memory per call as JSON.
+
+On CUDA, peak memory comes from the allocator. On CPU it is the peak rise in
+resident set size, sampled while the call runs, so treat it as approximate.
+
+Usage: python benchmarks/bench_ngram_attention.py [--ngram 2] [--heads 8] [--layers 2] [--tgt-len 64] [--beam 4]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import threading
+from argparse import Namespace
+from timeit import default_timer as timer
+
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import tokenizer  # noqa: E402
+from prophetnet.bert_dictionary import BertDictionary  # noqa: E402
+from prophetnet.ngram_multihead_attention import (  # noqa: E402
+    cached_ngram_attention_bias,
+    ngram_attention_bias,
+    relative_bucket_tables,
+)
+from prophetnet.ngram_s2s_model import NgramTransformerDecoder, base_architecture  # noqa: E402
+
+
+class PeakMemory(object):
+    """Measures the peak memory used while the block runs, in bytes."""
+
+    page_size = resource.getpagesize()
+
+    def __init__(self, device, interval=0.0005):
+        self.device = device
+        self.interval = interval
+        self.peak = 0
+
+    @staticmethod
+    def _rss():
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PeakMemory.page_size
+
+    def _sample(self):
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, self._rss() - self._baseline)
+
+    def __enter__(self):
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize()
+            torch.cuda.reset_max_memory_allocated(self.device)
+            self._baseline = torch.cuda.memory_allocated(self.device)
+            return self
+
+        self._baseline = self._rss()
+        self._done = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize()
+            self.peak = torch.cuda.max_memory_allocated(self.device) - self._baseline
+            return
+        self.peak = max(self.peak, self._rss() - self._baseline)
+        self._done.set()
+        self._sampler.join()
+
+
+def measure(run, device, repeat, warmup):
+    """Returns {'seconds': median time per call, 'peak_bytes': peak memory of one call}."""
+    for _ in range(warmup):
+        run()
+
+    times = []
+    for _ in range(repeat):
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        start = timer()
+        run()
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        times.append(timer() - start)
+
+    with PeakMemory(device) as memory:
+        run()
+
+    times.sort()
+    return {'seconds': times[len(times) // 2], 'peak_bytes': memory.peak}
+
+
+def build_decoder(args, dictionary, device):
+    model_args = Namespace(decoder_embed_dim=args.embed_dim, decoder_ffn_embed_dim=args.ffn_dim,
+                           decoder_layers=args.layers, decoder_attention_heads=args.heads, ngram=args.ngram,
+                           max_target_positions=args.max_positions, dropout=0.0,
+                           share_decoder_input_output_embed=True)
+    base_architecture(model_args)
+    embed_tokens = torch.nn.Embedding(len(dictionary), args.embed_dim, dictionary.pad())
+    return NgramTransformerDecoder(model_args, dictionary, embed_tokens).to(device).eval()
+
+
+def split_streams(attn, x, bsz):
+    """Projects x like NgramMultiheadAttention.forward, returning the main and predicting q/k/v."""
+    q, k, v = attn.in_proj_qkv(x)
+    q = q * attn.scaling
+    q, k, v = [t.contiguous().view(-1, bsz * attn.num_heads, attn.head_dim).transpose(0, 1) for t in (q, k, v)]
+    return [t.chunk(1 + attn.ngram, dim=1) for t in (q, k, v)]
+
+
+def attention_substeps(attn, decoder, x, real_positions, bsz, T):
+    """Returns the sub-steps of one full-sequence attention call as name -> zero-argument callables."""
+    ngram = attn.ngram
+    h_list = x.chunk(1 + ngram, dim=0)
+    q_list, k_list, v_list = split_streams(attn, x, bsz)
+    q_main, k_main, v_main = q_list[0], k_list[0], v_list[0]
+    i_main, i_relative = decoder.cal_finetune_relative_positions(real_positions)
+
+    attn_weights_main = torch.bmm(q_main, k_main.transpose(1, 2))
+    q_ngram = torch.cat(q_list[1:], 0).view(ngram, -1, T, attn.head_dim)
+    h_ngram = torch.cat(h_list[1:], 0).view(ngram, T, bsz, attn.embed_dim)
+
+    def cat_k_ngram():
+        return torch.cat([torch.cat([k_main, k_p], 1).unsqueeze(0) for k_p in k_list[1:]], 0)
+
+    k_ngram = cat_k_ngram()
+    v_ngram = torch.cat([torch.cat([v_main, v_p], 1).unsqueeze(0) for v_p in v_list[1:]], 0)
+    attn_weights_ngram = torch.einsum('nbtc,nbsc->nbts', (q_ngram, k_ngram))
+    probs_ngram = torch.softmax(attn_weights_ngram, dim=-1)
+
+    relative_positions = real_positions.unsqueeze(1).repeat(1, T, 1) - real_positions.unsqueeze(-1)
+
+    def cold(method, attribute):
+        def run():
+            setattr(decoder, attribute, None)
+            return method()
+        return run
+
+    def cold_shared(method, cache):
+        def run():
+            cache.cache_clear()
+            return method()
+        return run
+
+    return {
+        'ngram_attention_bias': lambda: ngram_attention_bias(T, ngram),
+        'future_mask (cold)': cold(lambda: decoder.buffered_future_mask(h_list[0]), '_future_mask'),
+        'future_mask_ngram (cold)': cold_shared(lambda: decoder.buffered_future_mask_ngram(h_list[0]),
+                                                cached_ngram_attention_bias),
+        'future_mask_ngram (cached)': lambda: decoder.buffered_future_mask_ngram(h_list[0]),
+        'finetune_relative_positions (cold)': cold_shared(
+            lambda: decoder.cal_finetune_relative_positions(real_positions), relative_bucket_tables),
+        'finetune_relative_positions (cached)': lambda: decoder.cal_finetune_relative_positions(real_positions),
+        'incremental_relative_positions': lambda: decoder.cal_incremental_relative_positions(T, x.device),
+        'relative_positions_bucket': lambda: attn._relative_positions_bucket(relative_positions, False),
+        'main_stream_relative_logits': lambda: attn.main_stream_relative_logits(
+            h_list[0], attn_weights_main, real_positions, i_main),
+        'ngram_relative_logits': lambda: attn.ngram_relative_logits(
+            h_ngram, attn_weights_ngram, real_positions, i_relative),
+        'cat k_ngram': cat_k_ngram,
+        'einsum qk': lambda: torch.einsum('nbtc,nbsc->nbts', (q_ngram, k_ngram)),
+        'einsum av': lambda: torch.einsum('nbts,nbsc->nbtc', (probs_ngram, v_ngram)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ngram', type=int, default=2)
+    parser.add_argument('--heads', type=int, default=8)
+    parser.add_argument('--layers', type=int, default=2)
+    parser.add_argument('--embed-dim', type=int, default=512)
+    parser.add_argument('--ffn-dim', type=int, default=2048)
+    parser.add_argument('--tgt-len', type=int, default=64, help='T, decoded target length')
+    parser.add_argument('--src-len', type=int, default=400)
+    parser.add_argument('--batch', type=int, default=1)
+    parser.add_argument('--beam', type=int, default=4)
+    parser.add_argument('--max-positions', type=int, default=512)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--threads', type=int, help='torch intra-op threads')
+    parser.add_argument('--cpu', action='store_true', help='use the CPU even if CUDA is available')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    device = torch.device('cuda' if torch.cuda.is_available() and not args.cpu else 'cpu')
+    torch.manual_seed(0)
+
+    dictionary = BertDictionary.load_from_file(tokenizer.vocab_path)
+    decoder = build_decoder(args, dictionary, device)
+    attn = decoder.layers[0].ngram_self_attn
+
+    bsz = args.batch * args.beam
+    T = args.tgt_len
+    C = args.embed_dim
+    tokens = torch.randint(dictionary.nspecial, len(dictionary), (bsz, T), device=device)
+    encoder_out = {'encoder_out': torch.randn(args.src_len, bsz, C, device=device), 'encoder_padding_mask': None}
+
+    _, real_positions = decoder.embed_positions(tokens)
+    x = torch.randn((1 + args.ngram) * T, bsz, C, device=device)
+    steps = [torch.randn(1 + args.ngram, bsz, C, device=device) for _ in range(T)]
+
+    def attention_full():
+        i_main, i_relative = decoder.cal_finetune_relative_positions(real_positions)
+        return attn(x, x, x, self_attn_mask=decoder.buffered_future_mask(x[:T]),
+                    ngram_mask_matrix=decoder.buffered_future_mask_ngram(x[:T]),
+                    i_buckets_main_stream=i_main, i_bucket_relative_stream=i_relative,
+                    real_positions=real_positions)
+
+    def attention_incremental():
+        incremental_state = {}
+        for t, x_t in enumerate(steps, 1):
+            position = dictionary.pad() + t
+            i_main, i_relative = decoder.cal_incremental_relative_positions(position, device)
+            attn(x_t, x_t, x_t, incremental_state=incremental_state, i_buckets_main_stream=i_main,
+                 i_bucket_relative_stream=i_relative, real_positions=tokens.new_full((1, 1), position))
+
+    def decoder_full():
+        return decoder.extract_features(tokens, encoder_out)
+
+    def decoder_incremental():
+        incremental_state = {}
+        for t in range(1, T + 1):
+            decoder.extract_features(tokens[:, :t], encoder_out, incremental_state)
+
+    results = {}
+    with torch.no_grad():
+        for name, run, calls in [('attention full', attention_full, 1),
+                                 ('attention incremental', attention_incremental, T),
+                                 ('decoder full', decoder_full, 1),
+                                 ('decoder incremental', decoder_incremental, T)]:
+            result = measure(run, device, args.repeat, args.warmup)
+            result['calls'] = calls
+            result['seconds_per_call'] = result['seconds'] / calls
+            results[name] = result
+
+        for name, run in attention_substeps(attn, decoder, x, real_positions, bsz, T).items():
+            result = measure(run, device, args.repeat, args.warmup)
+            result['calls'] = 1
+            result['seconds_per_call'] = result['seconds']
+            results['substep ' + name] = result
+
+    for name, result in results.items():
+        print('%-45s %10.3fms/call  %8d calls  %10.1fKB peak'
+              % (name, result['seconds_per_call'] * 1000, result['calls'], result['peak_bytes'] / 1024),
+              file=sys.stderr)
+
+    report = {
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'device': str(device),
+        'threads': torch.get_num_threads(),
+        'params': vars(args),
+        'results': results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""Times each stage of handle_request on synthetic audio with stub and tiny models.
+
+Generates a 16 kHz WAV whose speech and silence follow --pattern, then times
+frame_generator, vad_collector, vad_segment_generator, STT through a stub
+model, paragraph building, summarization chunking and generation with a
+randomly initialised ProphetNet built from base_architecture. Needs no model
+downloads and runs on CPU. The report is JSON so runs can be diffed between
+commits.
+
+Usage: python benchmarks/bench_pipeline.py [--minutes N] [--pattern 4:1,8:2] [--output report.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import wave
+from timeit import default_timer as timer
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import segmentation  # noqa: E402
+import summarizer  # noqa: E402
+import tokenizer  # noqa: E402
+import transcriber  # noqa: E402
+
+SAMPLE_RATE = 16000
+
+TINY_PROPHETNET = {
+    'encoder_embed_dim': 64, 'encoder_ffn_embed_dim': 128, 'encoder_layers': 2, 'encoder_attention_heads': 4,
+    'decoder_embed_dim': 64, 'decoder_ffn_embed_dim': 128, 'decoder_layers': 2, 'decoder_attention_heads': 4,
+    'max_source_positions': 512, 'max_target_positions': 512, 'share_all_embeddings': True, 'dropout': 0.0,
+}
+
+
+def parse_pattern(pattern):
+    """Parses 'speech:silence,...' seconds into a list of (speech, silence) pairs."""
+    return [tuple(float(part) for part in pair.split(':')) for pair in pattern.split(',')]
+
+
+def synthetic_speech(n_samples, rng):
+    """Voiced-sounding audio: harmonics of a wandering pitch, modulated at a syllable rate."""
+    t = np.arange(n_samples) / SAMPLE_RATE
+    pitch = rng.uniform(90, 220) * (1 + 0.1 * np.sin(2 * np.pi * rng.uniform(0.2, 1) * t))
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voice = sum(np.sin(k * phase) / k for k in range(1, 12))
+    syllables = 0.6 + 0.4 * np.sin(2 * np.pi * rng.uniform(3, 6) * t) ** 2
+    return 6000 * voice * syllables + rng.normal(0, 200, n_samples)
+
+
+def synthetic_wav(path, minutes, pattern, seed=0):
+    """Writes a mono 16-bit WAV cycling through pattern; returns the ground-truth speech spans in seconds."""
+    rng = np.random.RandomState(seed)
+    total = int(minutes * 60 * SAMPLE_RATE)
+    pieces = []
+    spans = []
+    position = 0
+    while position < total:
+        for speech, silence in pattern:
+            n_speech = int(speech * SAMPLE_RATE)
+            n_silence = int(silence * SAMPLE_RATE)
+            spans.append((position / SAMPLE_RATE, (position + n_speech) / SAMPLE_RATE))
+            pieces.append(synthetic_speech(n_speech, rng))
+            pieces.append(rng.normal(0, 30, n_silence))
+            position += n_speech + n_silence
+
+    audio = np.clip(np.concatenate(pieces)[:total], -32768, 32767).astype(np.int16)
+    transcriber.write_wave(path, audio.tobytes(), SAMPLE_RATE)
+    return spans
+
+
+class StubModel(object):
+    """Stands in for a DeepSpeech Model: returns words_per_second words of real vocabulary per second of audio."""
+
+    def __init__(self, words, words_per_second=2.5, seed=0):
+        self.words = words
+        self.words_per_second = words_per_second
+        self.rng = random.Random(seed)
+
+    def stt(self, audio):
+        n_words = max(int(len(audio) / SAMPLE_RATE * self.words_per_second), 1)
+        return ' '.join(self.rng.choice(self.words) for _ in range(n_words))
+
+
+def bench_frame_generator(state):
+    frames = transcriber.frame_generator(30, state['pcm'], SAMPLE_RATE)
+    return sum(1 for _ in frames), 'frames'
+
+
+def bench_vad_collector(state):
+    vad = transcriber.webrtcvad.Vad(state['aggressiveness'])
+    frames = transcriber.frame_generator(30, state['pcm'], SAMPLE_RATE)
+    state['ranges'] = list(transcriber.vad_collector(SAMPLE_RATE, 30, 300, vad, frames))
+    return state['n_frames'], 'frames'
+
+
+def bench_vad_segment_generator(state):
+    with wave.open(state['wav_path'], 'rb') as wav_data:
+        segments, _, _ = transcriber.vad_segment_generator(wav_data, state['aggressiveness'])
+        n_segments = sum(1 for _ in segments)
+    return n_segments, 'segments'
+
+
+def bench_stt_stub(state):
+    model = StubModel(state['words'])
+    pcm = memoryview(state['pcm'])
+    transcript = []
+    for start, end, timestamp in state['ranges']:
+        segment = np.frombuffer(pcm[start:end], dtype=np.int16)
+        inference, _, _ = transcriber.stt(model, segment, SAMPLE_RATE)
+        transcript.append((timestamp, inference))
+    state['transcript'] = transcript
+    return len(transcript), 'segments'
+
+
+def bench_paragraphs(state):
+    paragraphs = list(segmentation.segment(iter(state['transcript']), state['minute_increments']))
+    state['paragraphs'] = paragraphs
+    return len(paragraphs), 'paragraphs'
+
+
+def bench_paragraphs_stored(state):
+    return sum(1 for _ in segmentation.segment(list(state['transcript']), state['minute_increments'])), 'paragraphs'
+
+
+def bench_chunking(state):
+    wordpiece_tokenizer = state['tokenizer']
+    chunks = []
+    for _, _, sentences in state['paragraphs']:
+        chunks.extend(summarizer.pack_sentences(sentences, state['max_source_tokens'], wordpiece_tokenizer.count))
+    state['chunks'] = [chunk for chunk in chunks if chunk.strip()]
+    return len(state['chunks']), 'chunks'
+
+
+def bench_summarize_tiny(state):
+    engine = state['engine']
+    chunks = state['chunks'][:state['summaries']]
+    engine.summarize_batch(chunks)
+    return len(chunks), 'chunks'
+
+
+STAGES = [
+    ('frame_generator', bench_frame_generator),
+    ('vad_collector', bench_vad_collector),
+    ('vad_segment_generator', bench_vad_segment_generator),
+    ('stt_stub', bench_stt_stub),
+    ('paragraphs', bench_paragraphs),
+    ('paragraphs_stored', bench_paragraphs_stored),
+    ('chunking', bench_chunking),
+    ('summarize_tiny', bench_summarize_tiny),
+]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.realpath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--minutes', type=float, default=10)
+    parser.add_argument('--pattern', default='4:1,8:2,2:0.5,12:3', help='speech:silence seconds, repeated')
+    parser.add_argument('--aggressiveness', type=int, default=1)
+    parser.add_argument('--minute-increments', type=float, nargs='+', default=[1, 5])
+    parser.add_argument('--summaries', type=int, default=4, help='chunks to summarize with the tiny model')
+    parser.add_argument('--max-len', type=int, default=32, help='tokens generated per summary')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    state = {'aggressiveness': args.aggressiveness, 'minute_increments': args.minute_increments,
+             'summaries': args.summaries}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        state['wav_path'] = os.path.join(tmp_dir, 'synthetic.wav')
+        spans = synthetic_wav(state['wav_path'], args.minutes, parse_pattern(args.pattern))
+        with wave.open(state['wav_path'], 'rb') as wav_data:
+            state['pcm'], _, _ = transcriber.read_wave(wav_data)
+        state['n_frames'] = sum(1 for _ in transcriber.frame_generator(30, state['pcm'], SAMPLE_RATE))
+
+        setup_start = timer()
+        state['tokenizer'] = tokenizer.get_tokenizer()
+        state['words'] = [w for w in state['tokenizer'].dictionary.symbols if w.isalpha()]
+        state['engine'] = summarizer.SummarizerEngine(None, TINY_PROPHETNET)
+        state['engine'].args.max_len_b = args.max_len
+        state['engine'].generator = state['engine'].task.build_generator(state['engine'].args)
+        state['max_source_tokens'] = state['engine'].max_source_positions - 1
+        setup_time = timer() - setup_start
+
+        stages = {}
+        for name, run in STAGES:
+            times = []
+            for _ in range(args.repeat):
+                start = timer()
+                items, unit = run(state)
+                times.append(timer() - start)
+            best = min(times)
+            stages[name] = {'best_seconds': best,
+                            'mean_seconds': sum(times) / len(times),
+                            'items': items,
+                            'unit': unit,
+                            'items_per_second': items / best if best > 0 else None}
+            print('%-22s %9.4fs  %8d %-10s' % (name, best, items, unit), file=sys.stderr)
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'torch': summarizer.torch.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'params': vars(args),
+        'audio': {'seconds': len(state['pcm']) / 2 / SAMPLE_RATE, 'speech_spans': len(spans),
+                  'vad_segments': len(state['ranges'])},
+        'setup_seconds': setup_time,
+        'stages': stages,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
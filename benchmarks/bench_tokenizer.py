@@ -0,0 +1,69 @@
+"""Compares summarizer tokenization throughput before and after the cached tokenizer.
+
+The baseline is the old path: BertTokenizer.from_pretrained on every call,
+tokens joined into a line, then looked up again with BertDictionary.encode_line
+as fairseq-preprocess did.
+
+Usage: python benchmarks/bench_tokenizer.py [text_file] [--paragraphs N]
+"""
+import argparse
+import os
+import random
+import sys
+from timeit import default_timer as timer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from pytorch_transformers import BertTokenizer  # noqa: E402
+
+import tokenizer  # noqa: E402
+
+
+def synthetic_paragraphs(dictionary, count, words_per_paragraph=400, seed=0):
+    rng = random.Random(seed)
+    words = [w for w in dictionary.symbols if w.isalpha() and not w.startswith('##')]
+    return [' '.join(rng.choice(words) for _ in range(words_per_paragraph)) for _ in range(count)]
+
+
+def baseline(paragraphs, dictionary):
+    n_tokens = 0
+    for paragraph in paragraphs:
+        bert_tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')
+        line = ' '.join(bert_tokenizer.tokenize(paragraph))
+        n_tokens += dictionary.encode_line(line, add_if_not_exist=False).numel()
+    return n_tokens
+
+
+def cached(paragraphs, wordpiece_tokenizer):
+    return sum(ids.numel() for ids in wordpiece_tokenizer.encode_batch(paragraphs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('text_file', nargs='?', help='paragraphs, one per line (default: synthetic)')
+    parser.add_argument('--paragraphs', type=int, default=50)
+    args = parser.parse_args()
+
+    load_start = timer()
+    wordpiece_tokenizer = tokenizer.Tokenizer(tokenizer.vocab_path, 65536)
+    print('cached tokenizer load: %0.3fs' % (timer() - load_start))
+
+    if args.text_file:
+        with open(args.text_file, encoding='utf-8') as f:
+            paragraphs = [line.strip() for line in f if line.strip()][:args.paragraphs]
+    else:
+        paragraphs = synthetic_paragraphs(wordpiece_tokenizer.dictionary, args.paragraphs)
+
+    for name, run in [('baseline', lambda: baseline(paragraphs, wordpiece_tokenizer.dictionary)),
+                      ('cached (cold)', lambda: cached(paragraphs, wordpiece_tokenizer)),
+                      ('cached (warm)', lambda: cached(paragraphs, wordpiece_tokenizer))]:
+        start = timer()
+        n_tokens = run()
+        elapsed = timer() - start
+        print('%-14s %8d tokens in %7.3fs  %10.0f tokens/sec' % (name, n_tokens, elapsed, n_tokens / elapsed))
+
+    print('wordpiece cache: %s' % (wordpiece_tokenizer.cache_info(),))
+
+
+if __name__ == '__main__':
+    main()
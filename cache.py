@@ -0,0 +1,152 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+
+class ResultCache(object):
+    """A persistent, size-bounded LRU cache of finished summaries.
+
+    Entries are keyed by episode URL and minute increments and remember the
+    ETag, Last-Modified and Content-Length of the download they came from,
+    so a resubmission can revalidate with a conditional GET instead of
+    re-processing the episode. Without a strong ETag, a 304 that reports a
+    different Content-Length is not trusted.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+        self._lock = threading.Lock()
+        self._index_path = os.path.join(cache_dir, 'index.json')
+
+        os.makedirs(cache_dir, exist_ok=True)
+        try:
+            with open(self._index_path, 'r') as f:
+                self._index = json.load(f)
+        except (IOError, ValueError):
+            self._index = {}
+
+    @staticmethod
+    def key(url, minute_increments):
+        increments = ','.join(repr(float(m)) for m in minute_increments)
+        return hashlib.sha1(('%s\n%s' % (url, increments)).encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def _save_index(self):
+        tmp_path = self._index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self._index_path)
+
+    def lookup(self, url, minute_increments):
+        """Returns the cached entry, or None (counting a miss) if there isn't one."""
+        key = self.key(url, minute_increments)
+        with self._lock:
+            meta = self._index.get(key)
+            if meta is None:
+                self.misses += 1
+                return None
+
+            try:
+                with open(self._entry_path(key), 'r') as f:
+                    entry = json.load(f)
+                if 'summaries' not in entry:
+                    raise ValueError('entry predates multiple increments')
+            except (IOError, ValueError):
+                logging.warning('Dropping unreadable cache entry ' + key)
+                del self._index[key]
+                self._save_index()
+                self.misses += 1
+                return None
+
+            meta['last_used'] = time.time()
+            self._save_index()
+            return entry
+
+    @staticmethod
+    def conditional_headers(entry):
+        """Returns the request headers that revalidate entry, if it has any validators."""
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    @staticmethod
+    def is_fresh(entry, response):
+        """Whether a 304 response to conditional_headers(entry) shows the entry is still current.
+
+        Last-Modified and weak ETags can miss a changed file, so without a
+        strong ETag the lengths must also agree when the 304 reports one.
+        """
+        if response.status_code != 304:
+            return False
+        etag = entry.get('etag')
+        if etag and not etag.startswith('W/'):
+            return True
+        length = response.headers.get('Content-Length')
+        return not length or entry.get('content_length') is None or int(length) == entry['content_length']
+
+    def record_hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def record_stale(self):
+        with self._lock:
+            self.stale += 1
+
+    def store(self, url, minute_increments, response_headers, summaries):
+        key = self.key(url, minute_increments)
+        content_length = response_headers.get('Content-Length')
+        entry = {
+            'url': url,
+            'minute_increments': minute_increments,
+            'etag': response_headers.get('ETag'),
+            'last_modified': response_headers.get('Last-Modified'),
+            'content_length': int(content_length) if content_length else None,
+            'summaries': summaries,
+        }
+        if not entry['etag'] and not entry['last_modified']:
+            # without validators the entry could never be revalidated
+            return
+
+        data = json.dumps(entry)
+        with self._lock:
+            with open(self._entry_path(key), 'w') as f:
+                f.write(data)
+            self._index[key] = {'size': len(data), 'last_used': time.time()}
+            self._evict()
+            self._save_index()
+
+    def _evict(self):
+        total = sum(meta['size'] for meta in self._index.values())
+        for key, meta in sorted(self._index.items(), key=lambda item: item[1]['last_used']):
+            if total <= self.max_bytes:
+                break
+            total -= meta['size']
+            del self._index[key]
+            try:
+                os.remove(self._entry_path(key))
+            except OSError:
+                pass
+            logging.info('Evicted cached result ' + key)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._index),
+                    'bytes': sum(meta['size'] for meta in self._index.values()),
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'stale': self.stale}
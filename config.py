@@ -2,8 +2,43 @@ root_dir = '/dev/shm/'
 model_dir = 'models/'
 summarizer_model = 'cnndm.pt'
 lenpen = '0.8'
-preprocessworkers = '20'
-generateworkers = '4'
+summarizer_batch_size = '80'
 beam = '4'
 aggressiveness = 1  # 0-3
-summarizer_max_characters = 2000
+deepspeech_pool_size = 2  # DeepSpeech models shared across concurrent requests, keep above live_workers
+stt_workers = 1  # worker processes transcribing VAD segments in parallel, 1 to transcribe in-process
+tokenizer_cache_size = 65536  # distinct words whose WordPiece split is memoized
+summarizer_max_batch_tokens = 8192  # padded source tokens per cross-request batch
+summarizer_max_wait = 0.2  # seconds a chunk may wait for a batch to fill
+summarizer_bucket_width = 64  # source lengths batched together, in tokens
+stream_ingest = True  # pipe the download straight into ffmpeg instead of writing audio files
+download_chunk_size = 32768
+pcm_block_size = 96000  # 3s of 16kHz 16-bit mono, a whole number of 30ms frames
+min_minute_increment = 1  # smaller increments are refused, each empty bucket is still a paragraph
+max_minute_increments = 8  # distinct increments one request may ask for
+pipeline_queue_size = 4  # paragraphs in flight between transcription and summarization
+live_source_dir = '/tmp/live/'  # FIFOs that /live may read broadcasts from
+job_workers = 2  # requests processed concurrently
+job_queue_size = 8  # requests waiting for a worker before /request answers 429
+live_workers = 1  # live shows run concurrently on their own workers, each holding a DeepSpeech model throughout
+live_queue_size = 1  # live shows waiting for a worker before /live answers 429
+job_retry_after = 60  # seconds
+cache_dir = 'cache/'  # finished summaries, kept across restarts
+cache_max_bytes = 64 * 1024 * 1024
+artifact_dir = 'artifacts/'  # stage outputs keyed by content hash, so reruns skip finished stages
+stream_replay_size = 1000  # messages replayed to listeners that join late
+stream_flush_size = 50  # messages batched per write to stream.log
+stream_linger = 300  # seconds a finished stream stays available
+stream_keepalive = 15  # seconds between keepalives to idle listeners
+download_connections = 4  # concurrent byte ranges per download
+download_min_parallel_bytes = 8 * 1024 * 1024  # smaller files are fetched with a single GET
+download_pool_size = 16  # pooled HTTP connections shared by all downloads
+download_retries = 2  # retries per byte range
+download_timeout = 30  # seconds to connect or wait for data
+decode_workers = 1  # >1 decodes downloaded files as parallel time slices (when stream_ingest is off)
+decode_slice_seconds = 600
+decode_warmup_seconds = 10  # audio decoded before each slice so ffmpeg settles
+profile_dir = 'profiles/'  # outside root_dir so profiles outlive request cleanup
+profile_interval = 0.005  # seconds between stack samples of a profiled request
+progress_window = 20  # recent sentences and summaries the real-time factor and summary lag are averaged over
+progress_interval = 5  # minimum seconds between progress events on the stream
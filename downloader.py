@@ -0,0 +1,250 @@
+import logging
+import threading
+from timeit import default_timer as timer
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+import metrics
+
+
+class DownloadError(IOError):
+    pass
+
+
+class Download(object):
+    """A download in progress, read with iter_content like a requests response.
+
+    Records bytes received and throughput, and reports them to the
+    downloader once the body has been read to the end.
+    """
+
+    mode = 'stream'
+
+    def __init__(self, downloader, url, status_code, headers):
+        self.downloader = downloader
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.bytes = 0
+        self.ranges = 1
+        self.started = timer()
+        self.elapsed = None
+
+    def _finish(self):
+        if self.elapsed is None:
+            self.elapsed = timer() - self.started
+            self.downloader.record(self)
+
+    def throughput(self):
+        elapsed = self.elapsed if self.elapsed is not None else timer() - self.started
+        return self.bytes / elapsed if elapsed > 0 else 0.0
+
+    def stats(self):
+        return {'mode': self.mode,
+                'ranges': self.ranges,
+                'bytes': self.bytes,
+                'seconds': self.elapsed,
+                'bytes_per_second': self.throughput()}
+
+
+class StreamedDownload(Download):
+    """The body of a single GET, passed through as it arrives."""
+
+    def __init__(self, downloader, response):
+        super(StreamedDownload, self).__init__(downloader, response.url, response.status_code, response.headers)
+        self.response = response
+
+    def iter_content(self, chunk_size):
+        for chunk in self.response.iter_content(chunk_size):
+            self.bytes += len(chunk)
+            yield chunk
+        self._finish()
+
+    def close(self):
+        self.response.close()
+
+
+class _Part(object):
+    __slots__ = ('start', 'end', 'filled', 'error')
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end  # exclusive
+        self.filled = start
+        self.error = None
+
+
+class RangedDownload(Download):
+    """A file fetched as concurrent byte ranges into one preallocated buffer.
+
+    iter_content yields the buffer in order as soon as each stretch of it has
+    arrived, so decoding can start while later ranges are still downloading.
+    """
+
+    mode = 'ranged'
+
+    def __init__(self, downloader, url, headers, length, connections):
+        super(RangedDownload, self).__init__(downloader, url, 200, headers)
+        self.length = length
+        self.ranges = connections
+        self.closed = False
+
+        self._buffer = bytearray(length)
+        self._cond = threading.Condition()
+
+        # If-Range makes the server send the whole file instead of a part if it changed since the probe
+        self._validator = headers.get('ETag') or headers.get('Last-Modified')
+
+        step = -(-length // connections)
+        self._parts = [_Part(start, min(start + step, length)) for start in range(0, length, step)]
+        for part in self._parts:
+            threading.Thread(target=self._fetch, args=(part,), daemon=True).start()
+
+    def _fetch(self, part):
+        view = memoryview(self._buffer)
+        attempts = 0
+        while part.filled < part.end and not self.closed:
+            headers = {'Range': 'bytes=%d-%d' % (part.filled, part.end - 1)}
+            if self._validator:
+                headers['If-Range'] = self._validator
+            try:
+                with self.downloader.session.get(self.url, headers=headers, stream=True,
+                                                 timeout=self.downloader.timeout) as response:
+                    if response.status_code != 206:
+                        raise DownloadError('Expected 206 for range of %s, got %d' % (self.url, response.status_code))
+                    for chunk in response.iter_content(self.downloader.chunk_size):
+                        if self.closed:
+                            return
+                        n = min(len(chunk), part.end - part.filled)
+                        view[part.filled:part.filled + n] = chunk[:n]
+                        with self._cond:
+                            part.filled += n
+                            self._cond.notify_all()
+                        if part.filled == part.end:
+                            break
+                if part.filled < part.end:
+                    raise DownloadError('Range of %s ended early at byte %d' % (self.url, part.filled))
+            except (requests.exceptions.RequestException, DownloadError) as e:
+                attempts += 1
+                if attempts > self.downloader.retries:
+                    logging.error('Giving up on range %d-%d of %s: %s' % (part.start, part.end, self.url, e))
+                    with self._cond:
+                        part.error = e
+                        self._cond.notify_all()
+                    return
+                logging.warning('Retrying range %d-%d of %s: %s' % (part.filled, part.end, self.url, e))
+
+    def iter_content(self, chunk_size):
+        view = memoryview(self._buffer)
+        for part in self._parts:
+            position = part.start
+            while position < part.end:
+                with self._cond:
+                    while part.filled == position and part.error is None and not self.closed:
+                        self._cond.wait()
+                    if self.closed:
+                        return
+                    if part.filled == position:
+                        raise part.error
+                    filled = part.filled
+
+                while position < filled:
+                    n = min(chunk_size, filled - position)
+                    self.bytes += n
+                    yield view[position:position + n]
+                    position += n
+        self._finish()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class Downloader(object):
+    """Fetches episodes over one pooled HTTP session.
+
+    A HEAD probe decides how to download: files of at least min_parallel_bytes
+    from servers that accept byte ranges are fetched as several concurrent
+    ranges, everything else (including live streams) as a single GET.
+    """
+
+    def __init__(self, connections, min_parallel_bytes, pool_size, chunk_size, retries=2, timeout=None):
+        self.connections = connections
+        self.min_parallel_bytes = min_parallel_bytes
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+        self._totals = {'downloads': 0, 'ranged': 0, 'bytes': 0, 'seconds': 0.0}
+
+    def probe(self, url, headers=None):
+        """Returns the HEAD response for url, or None if the server doesn't answer HEAD usefully."""
+        try:
+            response = self.session.head(url, headers=headers, allow_redirects=True, timeout=self.timeout)
+        except requests.exceptions.MissingSchema:
+            raise
+        except requests.exceptions.RequestException as e:
+            logging.info('HEAD failed for %s: %s' % (url, e))
+            return None
+        response.close()
+        if response.status_code not in (200, 304):
+            return None
+        return response
+
+    def get(self, url, headers=None):
+        """Starts downloading url; headers are sent with the probe or single GET, e.g. for revalidation."""
+        head = self.probe(url, headers)
+        if head is not None and head.status_code == 304:
+            return StreamedDownload(self, head)
+
+        if head is not None and self.connections > 1:
+            length = int(head.headers.get('Content-Length') or 0)
+            accepts_ranges = head.headers.get('Accept-Ranges', '').lower() == 'bytes'
+            if accepts_ranges and length >= self.min_parallel_bytes:
+                logging.info('Downloading %s as %d ranges of %d bytes' % (url, self.connections, length))
+                return RangedDownload(self, head.url, head.headers, length, self.connections)
+
+        response = self.session.get(url, headers=headers, stream=True, timeout=self.timeout)
+        return StreamedDownload(self, response)
+
+    def record(self, download):
+        logging.info('Downloaded %s: %d bytes in %.2fs (%.0f KB/s, %d ranges)' % (
+            download.url, download.bytes, download.elapsed, download.throughput() / 1024, download.ranges))
+        metrics.stage_seconds.labels('download').observe(download.elapsed)
+        with self._lock:
+            self._totals['downloads'] += 1
+            self._totals['ranged'] += download.mode == 'ranged'
+            self._totals['bytes'] += download.bytes
+            self._totals['seconds'] += download.elapsed
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._totals)
+        stats['bytes_per_second'] = stats['bytes'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+        return stats
+
+
+_downloader = None
+_downloader_lock = threading.Lock()
+
+
+def get_downloader():
+    """Returns the process-wide downloader and its connection pool."""
+    global _downloader
+    with _downloader_lock:
+        if _downloader is None:
+            _downloader = Downloader(config.download_connections, config.download_min_parallel_bytes,
+                                     config.download_pool_size, config.download_chunk_size,
+                                     config.download_retries, config.download_timeout)
+            metrics.register_stats('podcast_downloader', 'Downloads', _downloader.stats,
+                                   ('downloads', 'ranged', 'bytes', 'seconds'))
+    return _downloader
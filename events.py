@@ -0,0 +1,121 @@
+import collections
+import functools
+import logging
+import threading
+
+
+class EventChannel(object):
+    """An in-memory stream of progress messages for one request.
+
+    Producers write messages and any number of listeners iterate them as
+    they arrive, starting with a replay of the last replay_size messages.
+    Messages are appended to a log file in batches of flush_size rather
+    than one open/append/close per message.
+    """
+
+    def __init__(self, log_path, replay_size, flush_size, on_close=None):
+        self.log_path = log_path
+        self.flush_size = flush_size
+        self.on_close = on_close
+        self.closed = False
+
+        self._cond = threading.Condition()
+        self._messages = collections.deque(maxlen=replay_size)
+        self._next_seq = 0
+        self._unflushed = []
+
+    def write(self, message):
+        with self._cond:
+            if self.closed:
+                return
+            self._messages.append(message)
+            self._next_seq += 1
+            self._unflushed.append(message)
+            if len(self._unflushed) >= self.flush_size:
+                self._flush()
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            if self.closed:
+                return
+            self.closed = True
+            self._flush()
+            self._cond.notify_all()
+
+        if self.on_close is not None:
+            self.on_close()
+
+    def _flush(self):
+        if not self._unflushed or self.log_path is None:
+            return
+        try:
+            with open(self.log_path, 'a') as f:
+                f.write(''.join(self._unflushed))
+        except IOError:
+            logging.warning('Could not write stream log ' + self.log_path)
+        self._unflushed = []
+
+    def listen(self, keepalive=None):
+        """Yields messages as they are written until the channel closes.
+
+        Yields None after keepalive seconds without a message, so servers
+        can notice disconnected clients. A listener that falls more than
+        replay_size messages behind skips to the oldest buffered message.
+        """
+        seq = None
+        while True:
+            with self._cond:
+                first_seq = self._next_seq - len(self._messages)
+                if seq is None or seq < first_seq:
+                    seq = first_seq
+                if seq == self._next_seq and not self.closed:
+                    self._cond.wait(keepalive)
+                    first_seq = self._next_seq - len(self._messages)
+                    seq = max(seq, first_seq)
+                pending = list(self._messages)[seq - first_seq:]
+                closed = self.closed
+
+            seq += len(pending)
+            for message in pending:
+                yield message
+            if not pending:
+                if closed:
+                    return
+                yield None
+
+
+class ChannelRegistry(object):
+    """The event channels of live requests, kept for a while after they close for late listeners."""
+
+    def __init__(self, replay_size, flush_size, linger):
+        self.replay_size = replay_size
+        self.flush_size = flush_size
+        self.linger = linger
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def open(self, request_id, log_path):
+        channel = EventChannel(log_path, self.replay_size, self.flush_size)
+        channel.on_close = functools.partial(self._linger, request_id, channel)
+        with self._lock:
+            self._channels[request_id] = channel
+        return channel
+
+    def get(self, request_id):
+        with self._lock:
+            return self._channels.get(request_id)
+
+    def _linger(self, request_id, channel):
+        timer = threading.Timer(self.linger, self._remove, (request_id, channel))
+        timer.daemon = True
+        timer.start()
+
+    def discard(self, request_id):
+        with self._lock:
+            self._channels.pop(request_id, None)
+
+    def _remove(self, request_id, channel):
+        with self._lock:
+            if self._channels.get(request_id) is channel:
+                del self._channels[request_id]
@@ -1,14 +1,123 @@
 import os
 import subprocess
+import threading
 import wave
 
 
+class DecodeError(IOError):
+    pass
+
+
 def mp3towav(mp3_path, wav_path):
     subprocess.run(
         ['/usr/bin/ffmpeg', '-loglevel', 'warning', '-hide_banner', '-y', '-i', mp3_path, '-acodec', 'pcm_s16le', '-ac', '1',
          '-ar', '16000', wav_path])
 
 
+def stream_to_pcm(chunks, sample_rate, block_size):
+    """Pipes encoded audio chunks through ffmpeg as they arrive.
+
+    Yields blocks of 16-bit mono PCM at the requested sample rate. Every block
+    except the last is exactly block_size bytes long. Once ffmpeg has drained,
+    re-raises any error reading the chunks and raises DecodeError if ffmpeg
+    failed, so a truncated download is never taken for the whole episode.
+    """
+    process = subprocess.Popen(
+        ['/usr/bin/ffmpeg', '-loglevel', 'warning', '-hide_banner', '-i', 'pipe:0', '-f', 's16le', '-acodec',
+         'pcm_s16le', '-ac', '1', '-ar', str(sample_rate), 'pipe:1'],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    feed_errors = []
+
+    def feed():
+        try:
+            for chunk in chunks:
+                if chunk:  # filter out keep-alive chunks
+                    process.stdin.write(chunk)
+        except (BrokenPipeError, ValueError):
+            # ffmpeg exited or the reader gave up early
+            pass
+        except Exception as e:
+            feed_errors.append(e)
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+
+    finished = False
+    try:
+        while True:
+            block = process.stdout.read(block_size)
+            if not block:
+                break
+            yield block
+        finished = True
+    finally:
+        if not finished:
+            process.kill()
+        process.stdout.close()
+        returncode = process.wait()
+        feeder.join()
+
+    if feed_errors:
+        raise feed_errors[0]
+    if returncode != 0:
+        raise DecodeError('ffmpeg exited with status %d' % returncode)
+
+
+def probe_duration(audio_path):
+    """Returns the duration of an audio file in seconds, as estimated by ffprobe."""
+    result = subprocess.run(
+        ['/usr/bin/ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of',
+         'default=noprint_wrappers=1:nokey=1', audio_path],
+        stdout=subprocess.PIPE, check=True)
+    return float(result.stdout)
+
+
+def decode_pcm(audio_path, sample_rate, block_size, start=0.0):
+    """Decodes an audio file from start seconds onwards.
+
+    Yields blocks of 16-bit mono PCM like stream_to_pcm. ffmpeg seeks on the
+    input, so decoding begins near start rather than at the top of the file.
+    Raises DecodeError once drained if ffmpeg failed.
+    """
+    process = subprocess.Popen(
+        ['/usr/bin/ffmpeg', '-loglevel', 'warning', '-hide_banner', '-ss', '%.3f' % start, '-i', audio_path, '-f',
+         's16le', '-acodec', 'pcm_s16le', '-ac', '1', '-ar', str(sample_rate), 'pipe:1'],
+        stdout=subprocess.PIPE)
+
+    finished = False
+    try:
+        while True:
+            block = process.stdout.read(block_size)
+            if not block:
+                break
+            yield block
+        finished = True
+    finally:
+        if not finished:
+            process.kill()
+        process.stdout.close()
+        returncode = process.wait()
+
+    if returncode != 0:
+        raise DecodeError('ffmpeg exited with status %d decoding %s' % (returncode, audio_path))
+
+
+def read_chunks(path, chunk_size):
+    """Yields chunks from a file or FIFO until the writer closes it."""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
 def get_wav_sample_rate(wav_path):
     with wave.open(wav_path, "rb") as wave_file:
         return wave_file.getframerate()
@@ -0,0 +1,78 @@
+import collections
+import logging
+import queue
+import threading
+
+
+class JobQueue(object):
+    """A fixed pool of worker threads fed from a bounded queue of jobs.
+
+    submit raises queue.Full instead of blocking once max_queued jobs are
+    waiting, so callers can turn overload away rather than pile it up.
+    """
+
+    def __init__(self, workers, max_queued):
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._lock = threading.Lock()
+        self._waiting = collections.OrderedDict()
+        self._running = set()
+        self._progress = {}
+
+        for _ in range(workers):
+            threading.Thread(target=self._work, daemon=True).start()
+
+    def submit(self, request_id, target, *args):
+        with self._lock:
+            self._queue.put_nowait((request_id, target, args))
+            self._waiting[request_id] = None
+        logging.info('Queued job %s, %d waiting' % (request_id, len(self._waiting)))
+
+    def _work(self):
+        while True:
+            request_id, target, args = self._queue.get()
+            with self._lock:
+                self._waiting.pop(request_id, None)
+                self._running.add(request_id)
+
+            try:
+                target(*args)
+            except Exception:
+                logging.exception('Job failed: ' + request_id)
+            finally:
+                with self._lock:
+                    self._running.discard(request_id)
+                    self._progress.pop(request_id, None)
+
+    def set_progress(self, request_id, progress):
+        """Attaches a running job's progress, anything with an estimate() dict, until the job ends."""
+        with self._lock:
+            if request_id in self._running:
+                self._progress[request_id] = progress
+
+    def status(self, request_id):
+        """Returns the job's state and queue position, or None if it is not queued or running.
+
+        Running jobs with attached progress also get its estimate, e.g. percent and predicted finish.
+        """
+        with self._lock:
+            if request_id in self._running:
+                state, position = 'running', 0
+            elif request_id in self._waiting:
+                state, position = 'queued', list(self._waiting).index(request_id) + 1
+            else:
+                return None
+
+            job_status = {'state': state,
+                          'position': position,
+                          'running': len(self._running),
+                          'queued': len(self._waiting)}
+            progress = self._progress.get(request_id)
+
+        if progress is not None:
+            job_status.update(progress.estimate())
+        return job_status
+
+    def stats(self):
+        with self._lock:
+            return {'workers': self.workers, 'running': len(self._running), 'queued': len(self._waiting)}
@@ -1,27 +1,64 @@
 from __future__ import division
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+import functools
+import json
 import subprocess
-import time
 import logging
+import math
 import requests
 import transcriber
 import summarizer
 import os
+import shutil
+import artifacts
+import cache
 import config
+import downloader
+import events
 import helpers
+import jobs
+import metrics
+import profiling
+import progress
 import threading
+import queue
+import segmentation
 import uuid
+from concurrent.futures import Future
+from timeit import default_timer as timer
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 logging.basicConfig(filename='log.log', level=logging.DEBUG, format='%(asctime)s %(levelname)s %(message)s')
 
 app = Flask(__name__)
 CORS(app)
 
+# load the DeepSpeech and summarizer models once at startup rather than per request
+if config.stt_workers > 1:
+    transcriber.get_stt_process_pool(config.model_dir)
+else:
+    transcriber.get_model_pool(config.model_dir)
+if config.decode_workers > 1:
+    transcriber.get_decode_pool()
+summarizer.get_scheduler(config.model_dir)
+
+channels = events.ChannelRegistry(config.stream_replay_size, config.stream_flush_size, config.stream_linger)
+result_cache = cache.ResultCache(config.cache_dir, config.cache_max_bytes)
+artifact_store = artifacts.ArtifactStore(config.artifact_dir)
+job_queue = jobs.JobQueue(config.job_workers, config.job_queue_size)
+# live shows never end, so they get their own workers rather than starving /request
+live_queue = jobs.JobQueue(config.live_workers, config.live_queue_size)
+
+metrics.jobs.labels('running').set_function(lambda: job_queue.stats()['running'])
+metrics.jobs.labels('queued').set_function(lambda: job_queue.stats()['queued'])
+metrics.root_dir_bytes.set_function(lambda: metrics.directory_bytes(config.root_dir))
+metrics.register_stats('podcast_live_jobs', 'Live show job queue', live_queue.stats)
+metrics.register_stats('podcast_result_cache', 'Result cache', result_cache.stats, ('hits', 'misses', 'stale'))
+
 
 def exit_stream(log_stream, request_dir=''):
-    with open(log_stream, 'a') as f:
-        f.write("EXIT_CODE")
+    log_stream.close()
     result = subprocess.run(['/usr/bin/rm', '-rf', request_dir])
     if result.returncode == 0:
         logging.info('Successfully cleaned up')
@@ -29,37 +66,40 @@ def exit_stream(log_stream, request_dir=''):
         logging.error('Error cleaning up')
 
 
-def download(url, output_filepath, log_stream):
+def download(url, log_stream, headers=None):
     logging.info("Starting download: " + url)
-    with open(log_stream, 'a') as f:
-        f.write("\nStarting download\n")
+    log_stream.write("\nStarting download\n")
 
-    response = None
     try:
-        response = requests.get(url)
+        return downloader.get_downloader().get(url, headers)
     except requests.exceptions.MissingSchema:
         logging.error('Invalid url')
-        with open(log_stream, 'a') as f:
-            f.write('\nInvalid url\n')
-        exit_stream(log_stream)
+        log_stream.write('\nInvalid url\n')
+        return None
+    except requests.exceptions.RequestException as e:
+        logging.error('Download failed: %s' % e)
+        log_stream.write('\nDownload failed\n')
+        return None
+
 
-    with open(log_stream, 'a') as f:
-        f.write("\nSaving file\n")
+def save_download(response, output_filepath, log_stream):
+    log_stream.write("\nSaving file\n")
     logging.info("Saving file: " + output_filepath)
 
     with open(output_filepath, 'wb') as file:
-        file.write(response.content)
+        for chunk in response.iter_content(config.download_chunk_size):
+            file.write(chunk)
 
 
 def convert_and_resample(audio_filepath, log_stream):
     basedir = os.path.dirname(audio_filepath) + '/'
 
-    with open(log_stream, 'a') as f:
-        f.write('\nConverting to wav\n')
+    log_stream.write('\nConverting to wav\n')
     logging.info('Converting to wav: ' + audio_filepath)
 
     wav_filepath = basedir + 'audio.wav'
-    helpers.mp3towav(audio_filepath, wav_filepath)
+    with metrics.stage_seconds.labels('convert').time():
+        helpers.mp3towav(audio_filepath, wav_filepath)
 
     # with open(log_stream, 'a') as f:
     #     f.write('\nResampling to 16kHz\n')
@@ -69,119 +109,463 @@ def convert_and_resample(audio_filepath, log_stream):
     # helpers.change_sample_rate(wav_filepath, resampled_wav_filepath, 16000, 1)
 
 
-def transcribe_into_paragraphs(wavfile_path, model_dir, minute_increment, log_stream):
-    with open(log_stream, 'a') as f:
-        f.write('\nBeginning transcription\n')
+def transcribe(wavfile_path, model_dir, log_stream, ranges=None, on_range=None, on_duration=None):
+    log_stream.write('\nBeginning transcription\n')
     logging.info('Beginning transcription: ' + wavfile_path)
 
-    sentences = transcriber.transcribe(wavfile_path, model_dir, log_stream)
+    return transcriber.transcribe(wavfile_path, model_dir, log_stream, ranges, on_range, on_duration)
 
-    increment = minute_increment * 60
-    paragraphs = []
-    paragraph = ''
-    for (timestamp, sentence) in sentences:
-        paragraph += (' ' + sentence)
 
-        if timestamp / increment > 1:
-            paragraphs.append(paragraph)
-            increment += increment
-            paragraph = ''
+def transcribe_stream(pcm_blocks, model_dir, log_stream, ranges=None, on_range=None):
+    log_stream.write('\nBeginning transcription\n')
+    logging.info('Beginning streaming transcription')
 
-    return paragraphs
+    return transcriber.transcribe_stream(pcm_blocks, model_dir, log_stream, ranges, on_range)
 
 
-def summarize(paragraphs, request_dir, model_dir, log_stream):
-    with open(log_stream, 'a') as f:
-        f.write('\nBeginning summary\n')
-    logging.info('Beginning summary: ' + request_dir)
+def transcribe_sliced(audio_filepath, request_dir, model_dir, log_stream, ranges=None, on_range=None):
+    log_stream.write('\nBeginning transcription\n')
+    logging.info('Beginning time-sliced transcription: ' + audio_filepath)
+
+    audio = transcriber.SlicedAudio(audio_filepath, request_dir + 'audio.pcm', transcriber.get_decode_pool(),
+                                    config.aggressiveness, config.decode_slice_seconds, config.decode_warmup_seconds)
+    return transcriber.transcribe_sliced(audio, model_dir, log_stream, ranges, on_range), audio
+
+
+def probe_duration(url, job_progress):
+    """Gives job_progress the duration ffprobe reads from a remote file's headers."""
+    try:
+        job_progress.set_duration(helpers.probe_duration(url))
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        logging.warning('Could not probe duration: ' + url)
+
+
+def artifact_keys(pcm_key, model_dir):
+    """Returns the VAD and transcript artifact keys derived from a PCM content hash."""
+    vad_key = artifacts.content_key(pcm_key, config.aggressiveness)
+    stt_model = os.path.basename(transcriber.resolve_models(model_dir)[0])
+    return vad_key, artifacts.content_key(vad_key, stt_model)
+
+
+def load_transcript(pcm_key, model_dir):
+    """Returns the deepest stored artifacts for some PCM: (transcript, VAD ranges), either may be None."""
+    if pcm_key is None:
+        return None, None
+
+    vad_key, transcript_key = artifact_keys(pcm_key, model_dir)
+    return artifact_store.get('transcript', transcript_key), artifact_store.get('vad', vad_key)
+
+
+def record_transcript(sentences, ranges, get_pcm_key, model_dir, source=None):
+    """Passes sentences through, storing the VAD ranges and transcript once transcription completes."""
+    transcript = []
+    for timestamp, sentence in sentences:
+        transcript.append((timestamp, sentence))
+        yield timestamp, sentence
+
+    pcm_key = get_pcm_key()
+    if pcm_key is None:
+        return
+
+    vad_key, transcript_key = artifact_keys(pcm_key, model_dir)
+    artifact_store.put('vad', vad_key, ranges)
+    artifact_store.put('transcript', transcript_key, transcript)
+    if source is not None:
+        artifact_store.put('source', source, pcm_key)
+
+
+def resume_transcript(transcript, log_stream):
+    log_stream.write('\nUsing stored transcription\n')
+    logging.info('Resuming from stored transcript')
+
+    return [(timestamp, sentence) for timestamp, sentence in transcript]
+
+
+def store_summary(key, future):
+    if future.exception() is None:
+        artifact_store.put('summary', key, future.result())
 
-    summary = []
-    for idx, paragraph in enumerate(paragraphs):
-        with open(log_stream, 'a') as f:
-            f.write('\nProcessing summary %002d\n' % idx)
 
-        # split paragraph up if too big
-        if len(paragraph) > config.summarizer_max_characters:
-            step = config.summarizer_max_characters
-            tmp_summary = ''
-            for i in range(0, len(paragraph), step):
-                tmp_summary += summarizer.summarize(paragraph[i:i + step], request_dir, model_dir, log_stream)
+def submit_summary(sentences, model_dir):
+    """Queues a paragraph's sentences, packed into encoder-sized chunks, and returns the chunk futures."""
+    if not ''.join(sentences).strip():
+        return []
 
-            summary.append(tmp_summary)
+    chunks = summarizer.pack(sentences, model_dir)
+
+    futures = []
+    for chunk in chunks:
+        key = artifacts.content_key(chunk, config.summarizer_model, config.beam, config.lenpen)
+        stored = artifact_store.get('summary', key)
+        if stored is not None:
+            future = Future()
+            future.set_result(stored)
         else:
-            summary.append(summarizer.summarize(paragraph, request_dir, model_dir, log_stream))
+            future = summarizer.submit_batch([chunk], model_dir)[0]
+            future.add_done_callback(functools.partial(store_summary, key))
+        futures.append(future)
+
+    return futures
+
+
+def summarize(sentences, minute_increments, request_dir, model_dir, log_stream, job_progress=None):
+    """Overlaps transcription and summarization.
+
+    A producer thread runs transcription, segments sentences into a paragraph
+    per time bucket of every requested increment and submits each finished
+    paragraph for summarization straight away. This thread emits the
+    timestamped summaries in order as they complete. The bounded queue
+    between the two applies backpressure to transcription, which trades
+    batching for latency: only about pipeline_queue_size paragraphs are
+    queued with the scheduler at once, so an episode is summarized over
+    several generations. A stored transcript, given as a list, has nothing
+    to overlap with, so all its paragraphs are submitted before waiting
+    and the scheduler can batch the whole episode.
+
+    Returns (a list of summaries per increment, one per bucket, and whether
+    every stage and chunk succeeded). Buckets without speech get an empty
+    summary, as do chunks that failed, and each failure is reported on
+    log_stream. job_progress, if given, is told of each transcribed
+    sentence and summary and reports to log_stream.
+    """
+    paragraph_queue = queue.Queue(maxsize=0 if isinstance(sentences, list) else config.pipeline_queue_size)
+    failures = []
+
+    def transcribed(item):
+        job_progress.transcribed(item[0])
+        job_progress.report(log_stream)
+
+    if job_progress is not None and not isinstance(sentences, list):
+        sentences = transcriber.observe(sentences, transcribed)
+
+    def produce():
+        try:
+            for i, idx, paragraph in segmentation.segment(sentences, minute_increments):
+                paragraph_queue.put((i, idx, submit_summary(paragraph, model_dir), timer()))
+            if job_progress is not None:
+                job_progress.transcription_finished()
+        except Exception as e:
+            logging.exception('Error transcribing: ' + request_dir)
+            log_stream.write('\nError transcribing, the summary will be incomplete\n')
+            failures.append(e)
+        finally:
+            paragraph_queue.put(None)
+
+    producer = threading.Thread(target=produce, name='transcribe ' + os.path.basename(request_dir.rstrip('/')),
+                                daemon=True)
+    producer.start()
+
+    log_stream.write('\nBeginning summary\n')
+    logging.info('Beginning summary: ' + request_dir)
+
+    summaries = [[] for _ in minute_increments]
+    while True:
+        item = paragraph_queue.get()
+        if item is None:
+            break
+
+        i, idx, futures, closed = item
+        minute_increment = minute_increments[i]
+        paragraph_summary = ''.join(summarizer.collect(futures))
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            log_stream.write('\nError summarizing %002d, the summary will be incomplete\n' % idx)
+            failures.extend(errors)
+        summaries[i].append(paragraph_summary)
+        if job_progress is not None:
+            job_progress.summarized(timer() - closed)
+            job_progress.report(log_stream)
+
+        log_stream.write('\nSummary %002d\n' % idx)
+        log_stream.write('\n%.2f-%.2f\n' % (idx * minute_increment, (idx + 1) * minute_increment))
+        log_stream.write('\n' + paragraph_summary + '\n')
 
-    return summary
+    producer.join()
 
+    return summaries, not failures
 
-def handle_request(download_link, request_id, minute_increment, log_stream):
+
+def handle_request(download_link, request_id, minute_increments, log_stream):
     request_dir = config.root_dir + request_id + '/'
     audio_filepath = request_dir + 'audio.mp3'
     model_dir = config.model_dir
 
     os.makedirs(request_dir, exist_ok=True)
+    job_progress = progress.Progress(config.progress_window, config.progress_interval)
+    job_queue.set_progress(request_id, job_progress)
+
+    cached = result_cache.lookup(download_link, minute_increments)
+    profiling.mark('download')
+    response = download(download_link, log_stream, result_cache.conditional_headers(cached))
+    if response is None:
+        exit_stream(log_stream, request_dir)
+        return
+
+    if cached is not None:
+        if result_cache.is_fresh(cached, response):
+            logging.info('Replaying cached summary: ' + download_link)
+            result_cache.record_hit()
+            response.close()
+            finish_request(cached['summaries'], minute_increments, request_dir, log_stream)
+            return
+        result_cache.record_stale()
+        if response.status_code == 304:
+            # the validators matched but the length didn't, so fetch the episode unconditionally
+            response.close()
+            response = download(download_link, log_stream)
+            if response is None:
+                exit_stream(log_stream, request_dir)
+                return
+
+    # resume from the deepest stage artifact stored for this audio
+    ranges = []
+    if config.stream_ingest:
+        source = artifacts.source_key(download_link, response.headers)
+        transcript, stored_ranges = load_transcript(artifact_store.get('source', source), model_dir)
+        if transcript is not None:
+            response.close()
+            sentences = resume_transcript(transcript, log_stream)
+        else:
+            # the length of streamed audio is only known from the remote file's headers
+            threading.Thread(target=probe_duration, args=(download_link, job_progress), daemon=True).start()
+            chunks = response.iter_content(config.download_chunk_size)
+            pcm_blocks = artifacts.HashingStream(helpers.stream_to_pcm(chunks, 16000, config.pcm_block_size))
+            sentences = transcribe_stream(pcm_blocks, model_dir, log_stream, stored_ranges, ranges.append)
+            sentences = record_transcript(sentences, ranges, pcm_blocks.hexdigest, model_dir, source)
+    elif config.decode_workers > 1:
+        source = artifacts.source_key(download_link, response.headers)
+        transcript, stored_ranges = load_transcript(artifact_store.get('source', source), model_dir)
+        if transcript is not None:
+            response.close()
+            sentences = resume_transcript(transcript, log_stream)
+        else:
+            save_download(response, audio_filepath, log_stream)
+            sentences, audio = transcribe_sliced(audio_filepath, request_dir, model_dir, log_stream,
+                                                 stored_ranges, ranges.append)
+            job_progress.set_duration(audio.duration)
+            sentences = record_transcript(sentences, ranges, audio.hexdigest, model_dir, source)
+    else:
+        save_download(response, audio_filepath, log_stream)
+        profiling.mark('convert')
+        convert_and_resample(audio_filepath, log_stream)
+
+        wav_filepath = request_dir + 'audio.wav'
+        pcm_key = artifacts.hash_wav(wav_filepath)
+        transcript, stored_ranges = load_transcript(pcm_key, model_dir)
+        if transcript is not None:
+            sentences = resume_transcript(transcript, log_stream)
+        else:
+            sentences = transcribe(wav_filepath, model_dir, log_stream, stored_ranges, ranges.append,
+                                   job_progress.set_duration)
+            sentences = record_transcript(sentences, ranges, lambda: pcm_key, model_dir)
+
+    # transcription runs lazily inside summarize, overlapped with summarization
+    profiling.mark('transcribe and summarize')
+    summaries, complete = summarize(sentences, minute_increments, request_dir, model_dir, log_stream, job_progress)
+    if complete:
+        result_cache.store(download_link, minute_increments, response.headers, summaries)
+    else:
+        logging.warning('Not caching incomplete summaries: ' + download_link)
+    job_progress.finish()
+
+    profiling.mark('finish')
+    finish_request(summaries, minute_increments, request_dir, log_stream, complete)
+
+
+def handle_live_request(source, request_id, minute_increments, log_stream):
+    request_dir = config.root_dir + request_id + '/'
+    model_dir = config.model_dir
+
+    os.makedirs(request_dir, exist_ok=True)
+
+    if source.startswith('http'):
+        response = download(source, log_stream)
+        if response is None:
+            exit_stream(log_stream, request_dir)
+            return
+        chunks = response.iter_content(config.download_chunk_size)
+    else:
+        logging.info('Reading live source: ' + source)
+        chunks = helpers.read_chunks(source, config.download_chunk_size)
 
-    download(download_link, audio_filepath, log_stream)
-    convert_and_resample(audio_filepath, log_stream)
+    log_stream.write('\nBeginning live transcription\n')
 
-    wav_filepath = request_dir + 'audio.wav'
-    paragraphs = transcribe_into_paragraphs(wav_filepath, model_dir, minute_increment, log_stream)
-    summary = summarize(paragraphs, request_dir, model_dir, log_stream)
+    pcm_blocks = helpers.stream_to_pcm(chunks, 16000, config.pcm_block_size)
+    sentences = transcriber.transcribe_live(pcm_blocks, model_dir, log_stream)
+    summaries, complete = summarize(sentences, minute_increments, request_dir, model_dir, log_stream)
 
-    with open(log_stream, 'a') as f:
-        f.write('\nFull Summary:\n')
+    finish_request(summaries, minute_increments, request_dir, log_stream, complete)
+
+
+def finish_request(summaries, minute_increments, request_dir, log_stream, complete=True):
+    incomplete = '' if complete else ' (incomplete)'
+    for minute_increment, summary in zip(minute_increments, summaries):
+        if len(minute_increments) == 1:
+            log_stream.write('\nFull Summary%s:\n' % incomplete)
+        else:
+            log_stream.write('\nFull Summary every %g minutes%s:\n' % (minute_increment, incomplete))
         for idx, line in enumerate(summary):
-            f.write('\n%.2f-%.2f\n' % (idx * minute_increment, (idx + 1) * minute_increment))
-            f.write('\n' + line + '\n')
+            log_stream.write('\n%.2f-%.2f\n' % (idx * minute_increment, (idx + 1) * minute_increment))
+            log_stream.write('\n' + line + '\n')
 
-    with open(log_stream, 'a') as f:
-        f.write('\nProcess Finished, please exit\n')
+    log_stream.write('\nProcess Finished, please exit\n')
 
     exit_stream(log_stream, request_dir)
 
     return
 
 
+def profile_path(request_id):
+    return os.path.join(config.profile_dir, request_id + '.json')
+
+
+def profile_request(target, source, request_id, minute_increments, log_stream):
+    """Runs a job under a RequestProfile saved outside the request directory, so it survives cleanup."""
+    profile = profiling.RequestProfile(profile_path(request_id), config.profile_interval)
+    profile.run(target, source, request_id, minute_increments, log_stream)
+
+
+def parse_increments(value):
+    """Returns the sorted, distinct minute increments requested as one number or a list of them.
+
+    Every bucket becomes a paragraph even when nothing was said in it, so
+    increments below config.min_minute_increment are refused along with
+    NaN and infinity.
+    """
+    values = value if isinstance(value, list) else [value]
+    minute_increments = sorted(set(float(v) for v in values))
+    if not minute_increments or len(minute_increments) > config.max_minute_increments:
+        raise ValueError('expected between 1 and %d minute increments' % config.max_minute_increments)
+    if not all(math.isfinite(m) and m >= config.min_minute_increment for m in minute_increments):
+        raise ValueError('minute_increment must be at least %g' % config.min_minute_increment)
+    return minute_increments
+
+
 @app.route('/request', methods=['POST'])
 def receive_request():
     request_id = str(uuid.uuid1())
 
     try:
         download_link = request.json['url']
-        minute_increment = float(request.json['minute_increment'])
+        minute_increments = parse_increments(request.json['minute_increment'])
     except KeyError:
         return "Missing parameters", 400
+    except (TypeError, ValueError):
+        return "Invalid minute_increment", 400
+
+    # profiled requests pay for the sampler and tracemalloc; all others run handle_request untouched
+    target = handle_request
+    if request.json.get('profile') is True:
+        target = functools.partial(profile_request, handle_request)
+
+    return enqueue(request_id, target, download_link, minute_increments)
+
+
+@app.route('/live', methods=['POST'])
+def receive_live_request():
+    request_id = str(uuid.uuid1())
+
+    try:
+        source = request.json['url'] if 'url' in request.json else request.json['path']
+        minute_increments = parse_increments(request.json['minute_increment'])
+    except KeyError:
+        return "Missing parameters", 400
+    except (TypeError, ValueError):
+        return "Invalid minute_increment", 400
+
+    # only FIFOs under the configured directory may be read from the local filesystem
+    if not source.startswith('http') and \
+            not os.path.realpath(source).startswith(os.path.realpath(config.live_source_dir) + os.sep):
+        return "Invalid source", 400
 
-    os.makedirs(config.root_dir + request_id + '/', exist_ok=True)
+    return enqueue(request_id, handle_live_request, source, minute_increments, live_queue)
 
-    log_stream = config.root_dir + request_id + '/stream.log'
-    with open(log_stream, 'a') as f:
-        f.write('Start\n')
 
-    thread = threading.Thread(target=handle_request, args=(download_link, request_id, minute_increment, log_stream))
-    thread.start()
+def run_job(target, source, request_id, minute_increments, log_stream):
+    """Runs a queued request, making sure a failure still ends its stream and removes its files."""
+    try:
+        target(source, request_id, minute_increments, log_stream)
+    except Exception:
+        logging.exception('Job failed: ' + request_id)
+        log_stream.write('\nError processing request\n')
+    finally:
+        if not log_stream.closed:
+            exit_stream(log_stream, config.root_dir + request_id + '/')
+
+
+def enqueue(request_id, target, source, minute_increments, target_queue=job_queue):
+    request_dir = config.root_dir + request_id + '/'
+    os.makedirs(request_dir, exist_ok=True)
+
+    log_stream = channels.open(request_id, request_dir + 'stream.log')
+    log_stream.write('Start\n')
+
+    try:
+        target_queue.submit(request_id, run_job, target, source, request_id, minute_increments, log_stream)
+    except queue.Full:
+        logging.warning('Job queue full, rejecting ' + request_id)
+        channels.discard(request_id)
+        shutil.rmtree(request_dir, ignore_errors=True)
+        return "Too many requests, please retry later", 429, {'Retry-After': str(config.job_retry_after)}
 
     response = jsonify({'request_id': request_id})
     return response, 202
 
 
+@app.route('/status/<string:request_id>', methods=['GET'])
+def status(request_id):
+    job_status = job_queue.status(request_id) or live_queue.status(request_id)
+    if job_status is None:
+        return "Job not found", 404
+
+    return jsonify(job_status)
+
+
 @app.route('/stream/<string:request_id>', methods=['GET'])
 def stream(request_id):
-    stream_filepath = config.root_dir + request_id + '/stream.log'
-    if not os.path.isfile(stream_filepath):
+    channel = channels.get(request_id)
+    if channel is None:
         return "Stream not found", 404
 
+    stream_format = request.args.get('format')
+    if stream_format is None:
+        stream_format = 'sse' if 'text/event-stream' in request.headers.get('Accept', '') else 'text'
+
     def generate():
-        with open(stream_filepath, 'r') as f:
-            while True:
-                line = str(f.read())
-                if line == 'EXIT_CODE':
-                    raise StopIteration
+        for message in channel.listen(config.stream_keepalive):
+            if stream_format == 'sse':
+                if message is None:
+                    yield ': keepalive\n\n'
                 else:
-                    yield line
-                time.sleep(1)
+                    yield ''.join('data: %s\n' % line for line in message.split('\n')) + '\n'
+            elif message is not None:
+                yield json.dumps({'message': message}) + '\n' if stream_format == 'ndjson' else message
+
+        if stream_format == 'sse':
+            yield 'event: end\ndata: \n\n'
+
+    mimetypes = {'sse': 'text/event-stream', 'ndjson': 'application/x-ndjson'}
+    return app.response_class(generate(), mimetype=mimetypes.get(stream_format, 'text/plain'))
+
+
+@app.route('/profile/<string:request_id>', methods=['GET'])
+def profile(request_id):
+    try:
+        with open(profile_path(request_id)) as f:
+            saved = f.read()
+    except (IOError, OSError):
+        return "Profile not found", 404
+
+    if request.args.get('format') == 'collapsed':
+        stacks = json.loads(saved)['stacks']
+        return ''.join('%s %d\n' % item for item in stacks.items()), 200, {'Content-Type': 'text/plain'}
+
+    return saved, 200, {'Content-Type': 'application/json'}
+
 
-    return app.response_class(generate(), mimetype='text/plain')
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return generate_latest(), 200, {'Content-Type': CONTENT_TYPE_LATEST}
 
 
 @app.route('/', methods=['GET'])
@@ -0,0 +1,67 @@
+import os
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+STAGE_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+RTF_BUCKETS = (.05, .1, .2, .3, .4, .5, .75, 1, 1.5, 2, 3, 5)
+
+stage_seconds = Histogram(
+    'podcast_stage_seconds',
+    'Time spent in each pipeline stage: download, convert and vad per request, stt per segment, '
+    'tokenize per summarizer input and summarize per generated batch.',
+    ['stage'], buckets=STAGE_BUCKETS)
+
+stt_real_time_factor = Histogram(
+    'podcast_stt_real_time_factor', 'DeepSpeech inference time over audio duration, per segment.',
+    buckets=RTF_BUCKETS)
+stt_audio_seconds = Counter('podcast_stt_audio_seconds_total', 'Seconds of audio transcribed.')
+stt_inference_seconds = Counter('podcast_stt_inference_seconds_total', 'Seconds spent in DeepSpeech inference.')
+
+model_load_seconds = Gauge('podcast_model_load_seconds', 'Time taken to load each model, most recent load.',
+                           ['model'])
+
+jobs = Gauge('podcast_jobs', 'Jobs running or waiting in the job queue.', ['state'])
+root_dir_bytes = Gauge('podcast_root_dir_bytes', 'Bytes of files under the working directory.')
+
+
+def observe_stt(inference_time, segment_length):
+    stage_seconds.labels('stt').observe(inference_time)
+    stt_inference_seconds.inc(inference_time)
+    stt_audio_seconds.inc(segment_length)
+    if segment_length > 0:
+        stt_real_time_factor.observe(inference_time / segment_length)
+
+
+def directory_bytes(path):
+    """Returns the total size of the files under path, skipping any that vanish while it walks."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class StatsCollector(object):
+    """Exports the numbers in a stats() dict at scrape time as prefix_key, counters for the keys in counters."""
+
+    def __init__(self, prefix, documentation, stats, counters=()):
+        self.prefix = prefix
+        self.documentation = documentation
+        self.stats = stats
+        self.counters = set(counters)
+
+    def collect(self):
+        for key, value in sorted(self.stats().items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            family = CounterMetricFamily if key in self.counters else GaugeMetricFamily
+            yield family('%s_%s' % (self.prefix, key), '%s: %s.' % (self.documentation, key.replace('_', ' ')),
+                         value=value)
+
+
+def register_stats(prefix, documentation, stats, counters=()):
+    REGISTRY.register(StatsCollector(prefix, documentation, stats, counters))
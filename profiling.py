@@ -0,0 +1,118 @@
+import collections
+import json
+import logging
+import os
+import sys
+import threading
+import tracemalloc
+from timeit import default_timer as timer
+
+_local = threading.local()
+_active_lock = threading.Lock()
+
+
+def mark(stage):
+    """Starts the named stage of the profile running on this thread, if there is one."""
+    profile = getattr(_local, 'profile', None)
+    if profile is not None:
+        profile.mark(stage)
+
+
+class StackSampler(object):
+    """Samples the Python stack of every thread at a fixed interval, counting collapsed stacks.
+
+    Each stack is 'thread name;file:function;...' from the outermost frame
+    in, the format flame graph tools read.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._done.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._done.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append('%s:%s' % (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+
+class RequestProfile(object):
+    """Profiles one request and saves the result as JSON at path.
+
+    Samples every thread's stack, since transcription and summarization run
+    on threads other than the request's own, and records the wall time and
+    tracemalloc peak of each stage the request marks. tracemalloc traces the
+    whole process, so only one request is profiled at a time; the others
+    run unprofiled.
+    """
+
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self.stages = []
+        self._stage = None
+
+    def run(self, target, *args):
+        if not _active_lock.acquire(blocking=False):
+            logging.warning('Another request is being profiled, not profiling ' + self.path)
+            return target(*args)
+
+        sampler = StackSampler(self.interval)
+        start = timer()
+        _local.profile = self
+        tracemalloc.start()
+        sampler.start()
+        self.mark('setup')
+        try:
+            return target(*args)
+        finally:
+            self.mark(None)
+            sampler.stop()
+            tracemalloc.stop()
+            _local.profile = None
+            _active_lock.release()
+            self._save(timer() - start, sampler)
+
+    def mark(self, stage):
+        """Ends the current stage and starts the next; None just ends it.
+
+        Clearing the traces resets the peak, so a stage's peak counts only
+        memory allocated during it.
+        """
+        now = timer()
+        if self._stage is not None:
+            name, started = self._stage
+            self.stages.append({'stage': name, 'seconds': now - started,
+                                'peak_bytes': tracemalloc.get_traced_memory()[1]})
+        tracemalloc.clear_traces()
+        self._stage = None if stage is None else (stage, now)
+
+    def _save(self, seconds, sampler):
+        profile = {'seconds': seconds, 'interval': self.interval, 'samples': sampler.samples,
+                   'stages': self.stages, 'stacks': dict(sampler.stacks.most_common())}
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(profile, f)
+        os.replace(tmp_path, self.path)
+        logging.info('Saved profile of %d samples to %s' % (sampler.samples, self.path))
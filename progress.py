@@ -0,0 +1,101 @@
+import collections
+import threading
+import time
+from timeit import default_timer as timer
+
+
+class Progress(object):
+    """Estimates how far along a request is and when it will finish.
+
+    Transcription speed is taken from the audio position of the last window
+    transcribed sentences against the wall time they arrived, a rolling
+    real-time factor covering decoding, VAD and STT together. Summaries lag
+    behind transcription by the time a closed paragraph waits for its
+    summary, so the rolling mean of that lag is added for the last one.
+    Without the audio duration only the lag-based tail can be estimated.
+    """
+
+    def __init__(self, window, report_interval):
+        self.report_interval = report_interval
+        self.duration = None
+        self.started = timer()
+        self._positions = collections.deque(maxlen=window)
+        self._lags = collections.deque(maxlen=window)
+        self._transcribed_at = None
+        self._finished = False
+        self._reported_at = None
+        self._lock = threading.Lock()
+
+    def set_duration(self, seconds):
+        with self._lock:
+            self.duration = seconds
+
+    def transcribed(self, timestamp):
+        """Records that the audio up to timestamp has been transcribed."""
+        with self._lock:
+            self._positions.append((timer(), timestamp))
+
+    def transcription_finished(self):
+        with self._lock:
+            self._transcribed_at = timer()
+
+    def summarized(self, lag):
+        """Records a summary that arrived lag seconds after its paragraph closed."""
+        with self._lock:
+            self._lags.append(lag)
+
+    def finish(self):
+        with self._lock:
+            self._finished = True
+
+    def _real_time_factor(self):
+        """Wall seconds per audio second over the window, or None before there are two points."""
+        if len(self._positions) < 2:
+            return None
+        (first_wall, first_audio), (last_wall, last_audio) = self._positions[0], self._positions[-1]
+        if last_audio <= first_audio:
+            return None
+        return (last_wall - first_wall) / (last_audio - first_audio)
+
+    def estimate(self):
+        """Returns percent complete, seconds to go, predicted finish as a Unix time and the real-time factor.
+
+        Values that cannot be estimated yet are None.
+        """
+        with self._lock:
+            now = timer()
+            rtf = self._real_time_factor()
+            lag = sum(self._lags) / len(self._lags) if self._lags else 0.0
+            finished = self._finished
+
+            if finished:
+                eta = 0.0
+            elif self._transcribed_at is not None:
+                eta = max(lag - (now - self._transcribed_at), 0.0)
+            elif rtf is not None and self.duration is not None:
+                last_wall, position = self._positions[-1]
+                remaining = max(self.duration - position, 0.0) * rtf - (now - last_wall)
+                eta = max(remaining, 0.0) + lag
+            else:
+                eta = None
+
+        if eta is None:
+            return {'percent': None, 'eta_seconds': None, 'predicted_finish': None, 'real_time_factor': rtf}
+
+        elapsed = now - self.started
+        percent = 100.0 if finished else min(100.0 * elapsed / (elapsed + eta), 99.9)
+        return {'percent': percent, 'eta_seconds': eta, 'predicted_finish': time.time() + eta,
+                'real_time_factor': rtf}
+
+    def report(self, log_stream):
+        """Writes a progress event, at most once every report_interval seconds."""
+        with self._lock:
+            now = timer()
+            if self._reported_at is not None and now - self._reported_at < self.report_interval:
+                return
+            self._reported_at = now
+
+        estimate = self.estimate()
+        if estimate['percent'] is not None:
+            log_stream.write('\nProgress %.1f%%, ETA %s\n'
+                             % (estimate['percent'], time.strftime('%H:%M:%S', time.gmtime(estimate['eta_seconds']))))
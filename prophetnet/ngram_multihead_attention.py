@@ -5,28 +5,72 @@
 # the root directory of this source tree. An additional grant of patent rights
 # can be found in the PATENTS file in the same directory.
 
+import functools
+
 import torch
 from torch import nn
 from torch.nn import Parameter
 import torch.nn.functional as F
-import numpy as np
 from fairseq import utils
 import math
 
-def ngram_attention_bias(length, num_skip):
-        bias_result = []
-        for n_skip in range(num_skip):
-            bias_n_skip = []
-            for i in range(length):
-                bias_this = [float('-inf')] * (2 * length)
-                bias_this[length+i] = 0
-                first_k = i - n_skip
-                first_k = first_k if first_k > 0 else 0
-                for j in range(first_k+1):
-                    bias_this[j] = 0
-                bias_n_skip.append(bias_this)
-            bias_result.append(bias_n_skip)
-        return torch.from_numpy(np.array(bias_result, dtype=np.float32))
+def ngram_attention_bias(length, num_skip, dtype=torch.float32, device=None):
+    """Returns the (num_skip, length, 2 * length) attention bias of the predicting streams.
+
+    Row i of stream n may see main-stream positions up to max(i - n, 0) and
+    its own position i in the predicting stream; every other entry is -inf.
+    """
+    i = torch.arange(length, device=device).view(1, length, 1)
+    n_skip = torch.arange(num_skip, device=device).view(num_skip, 1, 1)
+    j = torch.arange(length, device=device).view(1, 1, length)
+    visible = torch.cat([(j <= (i - n_skip).clamp(min=0)).expand(num_skip, length, length),
+                         (j == i).expand(num_skip, length, length)], 2)
+    return torch.full(visible.size(), float('-inf'), dtype=dtype, device=device).masked_fill_(visible, 0)
+
+
+@functools.lru_cache(maxsize=None)
+def cached_ngram_attention_bias(length, num_skip, dtype, device):
+    """ngram_attention_bias built once per (length, num_skip, dtype, device) and shared by every decoder.
+
+    Callers must not modify the returned tensor in place.
+    """
+    return ngram_attention_bias(length, num_skip, dtype, device)
+
+
+def relative_positions_bucket(relative_positions, num_buckets, max_distance, bidirectional=False):
+    """Maps relative positions to buckets: one per distance below num_buckets // 2, log-spaced up to max_distance."""
+    n = -relative_positions
+    result = 0
+    if bidirectional:
+        num_buckets = num_buckets // 2
+        result = result + torch.lt(n, torch.zeros_like(n)).int() * num_buckets
+        n = torch.abs(n)
+    else:
+        n = torch.max(n, torch.zeros_like(n))
+    max_exact = num_buckets // 2
+    is_small = torch.lt(n, max_exact)
+    val_if_large = max_exact + torch.log(n.float() / max_exact) / math.log(max_distance / max_exact) * (
+                num_buckets - max_exact)
+    val_if_large = torch.min(val_if_large, torch.ones_like(val_if_large) * (num_buckets - 1))
+    val_if_large = val_if_large.int()
+    result = result + torch.where(is_small, n.int(), val_if_large)
+    return result
+
+
+@functools.lru_cache(maxsize=None)
+def relative_bucket_tables(length, num_buckets, max_distance, device):
+    """Returns the main and predicting stream bucket tables for positions 1..length, shared by every decoder.
+
+    Row i of the [length, length] main table holds the buckets of keys at
+    positions 1..length seen from a query at position i + 1. Row i of the
+    [length, 2*length] predicting table holds those of keys at positions
+    0..length-1 followed by 1..length. Callers must not modify them in place.
+    """
+    positions = torch.arange(1, length + 1)
+    main = relative_positions_bucket(positions.unsqueeze(0) - positions.unsqueeze(1), num_buckets, max_distance)
+    predicting = relative_positions_bucket(torch.cat([positions - 1, positions]).unsqueeze(0) - positions.unsqueeze(1),
+                                           num_buckets, max_distance)
+    return main.long().to(device), predicting.long().to(device)
 
 
 class NgramMultiheadAttention(nn.Module):
@@ -108,36 +152,21 @@ class NgramMultiheadAttention(nn.Module):
             nn.init.xavier_normal_(self.bias_v)
 
     def _relative_positions_bucket(self, relative_positions, bidirectional=False):
-        num_buckets = self.num_buckets
-        max_distance = self.relative_max_distance
-        n = -relative_positions
-        result = 0
-        if bidirectional:
-            num_buckets = num_buckets // 2
-            result = result + torch.lt(n, torch.zeros_like(n)).int() * num_buckets
-            n = torch.abs(n)
-        else:
-            n = torch.max(n, torch.zeros_like(n))
-        max_exact = num_buckets // 2
-        is_small = torch.lt(n, max_exact)
-        val_if_large = max_exact + torch.log(n.float() / max_exact) / math.log(max_distance / max_exact) * (
-                    num_buckets - max_exact)
-        val_if_large = torch.min(val_if_large, torch.ones_like(val_if_large) * (num_buckets - 1))
-        val_if_large = val_if_large.int()
-        result = result + torch.where(is_small, n.int(), val_if_large)
-        return result
+        return relative_positions_bucket(relative_positions, self.num_buckets, self.relative_max_distance,
+                                         bidirectional)
 
 
     def main_stream_relative_logits(self,query, attn_weights, real_positions,i_bucket_main_stream):
         # input query [T,B,C]
         # input attn_weights [T*head,T,S]
         # input real_positions [B,T] or [1,1]
+        # input i_bucket_main_stream [B,T,T], [1,1,keys] when decoding incrementally, or None
 
         T,B,_ = query.size()
         S = attn_weights.size(-1)
 
         if i_bucket_main_stream is not None:
-            i_buckets = i_bucket_main_stream
+            i_buckets = i_bucket_main_stream[:, :, :S]
         else:
             # [B,T,S]
             relative_positions = torch.arange(1, S+1).unsqueeze(0).unsqueeze(0).repeat(B,T,1).to(real_positions.device)
@@ -158,18 +187,12 @@ class NgramMultiheadAttention(nn.Module):
         values = values.transpose(1,3)
         # [B,head,T,Buckets]
         values = values.transpose(2,3)
-        # [B*head,T,Buckets]
-        values = values.reshape(attn_weights.size(0),attn_weights.size(1),-1)
-
-        # => [B,head*T,T] => [B*head,T,T]
-        i_buckets = i_buckets.repeat(1,self.num_heads,1).view(attn_weights.size(0),attn_weights.size(1),-1)
-        # [B*head*T,Buckets]
-        values = values.reshape(-1, values.size(-1))
-        # [B*head*T,T]
-        i_buckets = i_buckets.view(-1, i_buckets.size(-1)).long()
-        # [B*head*T,T]
-        result = torch.gather(values,dim=1,index=i_buckets)
-        # [B*head,T,T]
+
+        # [B,head,T,S], an expanded view so every head gathers with the same buckets
+        i_buckets = i_buckets.long().unsqueeze(1).expand(B, self.num_heads, T, S)
+        # [B,head,T,S]
+        result = torch.gather(values,dim=3,index=i_buckets)
+        # [B*head,T,S]
         result = result.view(attn_weights.size(0),attn_weights.size(1),-1)
 
         return result
@@ -178,13 +201,13 @@ class NgramMultiheadAttention(nn.Module):
         # input query [ngram, T,B,C]
         # input attn_weights [ngram, B*head,T,S]
         # input real_positions [B,T] or [1,1]
-        # input i_bucket_relative_stream [B,T, 2*T] or None
+        # input i_bucket_relative_stream [B,T, 2*T], [1,1,keys] when decoding incrementally, or None
 
         N, T, B, _ = query.size()
         _, BH, _, S = attn_weights.size()
 
         if i_bucket_relative_stream is not None:
-            i_buckets = i_bucket_relative_stream
+            i_buckets = i_bucket_relative_stream[:, :, :S]
         else:
             # [B,T,S]
             assert real_positions[0][0] == S - 1, 'memory position is 1 2 3 4 5(S-1)'
@@ -205,16 +228,11 @@ class NgramMultiheadAttention(nn.Module):
         values = values.view(*values.size()[:-1],self.num_buckets, self.num_heads)
         # [ngram, B, head, T, bucket]
         values = values.permute(0, 1, 4, 2, 3)
-        # [ngram*B*head, T, bucket]
-        values = values.reshape(N*BH,T,-1)
-
-        # [ngram, B, head*T, S]
-        i_buckets = i_buckets.unsqueeze(0).repeat(N,1,self.num_heads,1)
 
-        values = values.reshape(-1, values.size(-1))
-        i_buckets = i_buckets.view(-1, i_buckets.size(-1)).long()
-        # [ngram*B*head*T, S]
-        result = torch.gather(values,dim=1,index=i_buckets)
+        # [ngram, B, head, T, S], an expanded view so every ngram and head gathers with the same buckets
+        i_buckets = i_buckets.long().unsqueeze(0).unsqueeze(2).expand(N, B, self.num_heads, T, S)
+        # [ngram, B, head, T, S]
+        result = torch.gather(values,dim=4,index=i_buckets)
         # [ngram, B*head, T, S]
         result = result.view(N, BH , T, -1)
 
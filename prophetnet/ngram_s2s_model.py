@@ -1,5 +1,3 @@
-import math
-
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -18,7 +16,12 @@ from fairseq.modules import (
 )
 from fairseq.modules.transformer_sentence_encoder import init_bert_params
 from .learned_positional_embedding import LearnedPositionalEmbedding
-from .ngram_multihead_attention import NgramMultiheadAttention, ngram_attention_bias
+from .ngram_multihead_attention import (
+    NgramMultiheadAttention,
+    cached_ngram_attention_bias,
+    relative_bucket_tables,
+    relative_positions_bucket,
+)
 
 DEFAULT_MAX_SOURCE_POSITIONS = 512
 DEFAULT_MAX_TARGET_POSITIONS = 512
@@ -598,24 +601,8 @@ class NgramTransformerDecoder(FairseqIncrementalDecoder):
         return x_predicted, extra
 
     def _relative_positions_bucket(self, relative_positions, bidirectional=False):
-        num_buckets = self.num_buckets
-        max_distance = self.relative_max_distance
-        n = -relative_positions
-        result = 0
-        if bidirectional:
-            num_buckets = num_buckets // 2
-            result = result + torch.lt(n, torch.zeros_like(n)).int() * num_buckets
-            n = torch.abs(n)
-        else:
-            n = torch.max(n, torch.zeros_like(n))
-        max_exact = num_buckets // 2
-        is_small = torch.lt(n, max_exact)
-        val_if_large = max_exact + torch.log(n.float() / max_exact) / math.log(max_distance / max_exact) * (
-                num_buckets - max_exact)
-        val_if_large = torch.min(val_if_large, torch.ones_like(val_if_large) * (num_buckets - 1))
-        val_if_large = val_if_large.int()
-        result = result + torch.where(is_small, n.int(), val_if_large)
-        return result
+        return relative_positions_bucket(relative_positions, self.num_buckets, self.relative_max_distance,
+                                         bidirectional)
 
     def cal_pretrain_relative_positions(self, real_positions):
         # main stream
@@ -643,27 +630,37 @@ class NgramTransformerDecoder(FairseqIncrementalDecoder):
                                                                    bidirectional=False)
         return i_buckets_main_stream, i_bucket_relative_stream
 
+    def relative_bucket_tables(self, device):
+        # one position more than the decoder supports: at the last incremental step the predicting stream also
+        # attends to its own key, after max_target_positions main stream keys
+        return relative_bucket_tables(self.max_target_positions + 1, self.num_buckets, self.relative_max_distance,
+                                      device)
+
     def cal_finetune_relative_positions(self, real_positions):
         n_tokens = real_positions.size(-1)
         batch_size = real_positions.size(0)
-        if not hasattr(self,
-                       '_finetune_i_bucket_main_stream') or \
-                self._finetune_i_bucket_main_stream is None \
-                or self._finetune_i_bucket_main_stream.device != real_positions.device:
-            fake_positions = torch.arange(1, self.max_target_positions + 1).repeat(1, 1)
-            finetune_i_bucket_main_stream, finetune_i_bucket_predicting_stream = \
-                self.cal_pretrain_relative_positions(fake_positions)
-            self._finetune_i_bucket_main_stream = finetune_i_bucket_main_stream.to(real_positions.device)
-            self._finetune_i_bucket_predicting_stream = finetune_i_bucket_predicting_stream.to(real_positions.device)
-        finetune_i_bucket_main_stream = self._finetune_i_bucket_main_stream[:, :n_tokens, :n_tokens].repeat(batch_size,
-                                                                                                            1, 1)
+        main_table, predicting_table = self.relative_bucket_tables(real_positions.device)
+        length = main_table.size(0)
+        # [B,T,T] and [B,T,2*T], expanded over the batch rather than copied
+        finetune_i_bucket_main_stream = main_table[:n_tokens, :n_tokens].unsqueeze(0).expand(batch_size, -1, -1)
         finetune_i_bucket_predicting_stream = torch.cat([
-            self._finetune_i_bucket_predicting_stream[:, :n_tokens, :n_tokens],
-            self._finetune_i_bucket_predicting_stream[:, :n_tokens,
-            self.max_target_positions:self.max_target_positions + n_tokens]
-        ], 2).repeat(batch_size, 1, 1)
+            predicting_table[:n_tokens, :n_tokens],
+            predicting_table[:n_tokens, length:length + n_tokens]
+        ], 1).unsqueeze(0).expand(batch_size, -1, -1)
         return finetune_i_bucket_main_stream, finetune_i_bucket_predicting_stream
 
+    def cal_incremental_relative_positions(self, position, device):
+        """Returns the buckets of the single query of an incremental step at the given position.
+
+        They are rows of the shared tables covering every key position,
+        [1,1,max_target_positions+1], so one slice per step serves all
+        layers; each layer cuts them down to the keys it has.
+        """
+        main_table, predicting_table = self.relative_bucket_tables(device)
+        i_buckets_main_stream = main_table[position - 1:position].unsqueeze(0)
+        i_bucket_relative_stream = predicting_table[position - 1:position, :main_table.size(0)].unsqueeze(0)
+        return i_buckets_main_stream, i_bucket_relative_stream
+
     def extract_features(self, prev_output_tokens, encoder_out=None, incremental_state=None, **unused):
         # embed positions
         # [bos, A, B, C, D, eos] with real positions [1,2,3,4,5,6](main stream), [2,3,4,5,6,7](predicting stream)
@@ -683,7 +680,9 @@ class NgramTransformerDecoder(FairseqIncrementalDecoder):
                 incremental_state=incremental_state,
             ) if self.embed_positions is not None else None
             if incremental_state is not None:
-                i_buckets_main_stream, i_bucket_relative_stream = None, None
+                # the same position LearnedPositionalEmbedding gives the step
+                i_buckets_main_stream, i_bucket_relative_stream = self.cal_incremental_relative_positions(
+                    self.padding_idx + prev_output_tokens.size(1), prev_output_tokens.device)
             else:
                 i_buckets_main_stream, i_bucket_relative_stream = \
                     self.cal_finetune_relative_positions(real_positions)
@@ -810,13 +809,9 @@ class NgramTransformerDecoder(FairseqIncrementalDecoder):
 
     def buffered_future_mask_ngram(self, tensor):
         dim = tensor.size(0)
-        if not hasattr(self,
-                       '_ngram_future_mask') or self._ngram_future_mask is None or self._ngram_future_mask.device != tensor.device:
-            self._ngram_future_mask = ngram_attention_bias(self.max_target_positions, self.ngram).type(tensor.dtype).to(
-                tensor.device)
-        ngram_future_mask = torch.cat([self._ngram_future_mask[:, :dim, :dim],
-                                       self._ngram_future_mask[:, :dim,
-                                       self.max_target_positions: self.max_target_positions + dim]
+        bias = cached_ngram_attention_bias(self.max_target_positions, self.ngram, tensor.dtype, tensor.device)
+        ngram_future_mask = torch.cat([bias[:, :dim, :dim],
+                                       bias[:, :dim, self.max_target_positions: self.max_target_positions + dim]
                                        ], 2)
         return ngram_future_mask
 
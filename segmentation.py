@@ -0,0 +1,126 @@
+import collections
+import itertools
+
+import numpy as np
+
+
+class Transcript(object):
+    """A complete transcript held as each sentence's timestamp and its text as ' ' + sentence.
+
+    A paragraph is then a run of consecutive sentences, and its text is
+    ''.join of them.
+    """
+
+    def __init__(self):
+        self.timestamps = []
+        self._parts = []
+
+    def __len__(self):
+        return len(self._parts)
+
+    def append(self, timestamp, sentence):
+        self._parts.append(' ' + sentence)
+        self.timestamps.append(timestamp)
+
+    def sentences(self, start, end):
+        """Returns sentences [start, end), each as it appears in the paragraph text."""
+        return self._parts[start:end]
+
+    def bucket_edges(self, minute_increments):
+        """Returns, per increment, the index of the first sentence of every bucket plus len(self).
+
+        Bucket i of an increment holds the sentences whose timestamps fall in
+        [i * increment, (i + 1) * increment). The boundaries of all increments
+        are located with a single searchsorted over the timestamps.
+        """
+        timestamps = np.asarray(self.timestamps, dtype=np.float64)
+        if not len(timestamps):
+            return {m: np.zeros(1, dtype=np.int64) for m in minute_increments}
+        last = timestamps[-1]
+
+        boundaries = [np.arange(1, int(last // (m * 60)) + 1) * (m * 60) for m in minute_increments]
+        cuts = np.searchsorted(timestamps, np.concatenate(boundaries), side='left')
+
+        edges = {}
+        position = 0
+        for m, increment_boundaries in zip(minute_increments, boundaries):
+            n = len(increment_boundaries)
+            edges[m] = np.concatenate(([0], cuts[position:position + n], [len(timestamps)]))
+            position += n
+        return edges
+
+
+class Segmenter(object):
+    """Closes paragraphs at several time granularities as a transcript streams in.
+
+    A bucket closes as soon as a sentence starts beyond it, and finish closes
+    the last bucket of every increment. Only sentences in a bucket that some
+    increment still has open are kept, so memory stays bounded however long
+    the transcript runs.
+    """
+
+    def __init__(self, minute_increments):
+        self.minute_increments = list(minute_increments)
+        self._parts = collections.deque()
+        self._first = 0  # index of the sentence at self._parts[0]
+        self._count = 0
+        self._buckets = [0] * len(self.minute_increments)
+        self._starts = [0] * len(self.minute_increments)
+
+    def feed(self, timestamp, sentence):
+        """Adds a sentence, returning (increment index, bucket index, sentences) for each bucket it closes."""
+        closed = []
+        for i, m in enumerate(self.minute_increments):
+            bucket = int(timestamp // (m * 60))
+            while self._buckets[i] < bucket:
+                closed.append(self._close(i))
+        self._release()
+        self._parts.append(' ' + sentence)
+        self._count += 1
+        return closed
+
+    def finish(self):
+        closed = [self._close(i) for i in range(len(self.minute_increments)) if self._starts[i] < self._count]
+        self._release()
+        return closed
+
+    def _close(self, i):
+        start = self._starts[i] - self._first
+        closed = (i, self._buckets[i], list(itertools.islice(self._parts, start, None)))
+        self._buckets[i] += 1
+        self._starts[i] = self._count
+        return closed
+
+    def _release(self):
+        """Drops the sentences every increment has already closed a bucket over."""
+        while self._first < min(self._starts):
+            self._parts.popleft()
+            self._first += 1
+
+
+def segment(sentences, minute_increments):
+    """Yields (increment index, bucket index, paragraph sentences) for (timestamp, sentence) pairs, in time order.
+
+    The paragraph text is ''.join of its sentences, which is empty for a
+    bucket without speech. A list is taken to be a complete transcript and
+    bucketed in one pass; any other iterable is segmented as it streams in.
+    """
+    if isinstance(sentences, list):
+        transcript = Transcript()
+        for timestamp, sentence in sentences:
+            transcript.append(timestamp, sentence)
+
+        closed = []
+        for i, (m, edges) in enumerate(transcript.bucket_edges(minute_increments).items()):
+            for idx in range(len(edges) - 1):
+                closed.append(((idx + 1) * m, i, idx, transcript.sentences(edges[idx], edges[idx + 1])))
+        for _, i, idx, paragraph in sorted(closed, key=lambda item: item[:3]):
+            yield i, idx, paragraph
+        return
+
+    segmenter = Segmenter(minute_increments)
+    for timestamp, sentence in sentences:
+        for closed in segmenter.feed(timestamp, sentence):
+            yield closed
+    for closed in segmenter.finish():
+        yield closed
@@ -1,48 +1,345 @@
+import collections
+import copy
 import logging
 import os
-import subprocess
-import sys
+import queue
+import threading
+from concurrent.futures import Future
+from timeit import default_timer as timer
+
+import torch
+from fairseq import checkpoint_utils, options, utils
+
 import config
-from pytorch_transformers import BertTokenizer
+import metrics
+import tokenizer
+
+prophetnet_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'prophetnet')
+
+
+def detokenize(line):
+    """Merges WordPiece continuations and strips ProphetNet sentence separators."""
+    return line.replace(' ##', '').replace('[X_SEP]', '').strip()
+
+
+def pack_sentences(sentences, max_tokens, count_tokens):
+    """Joins consecutive sentences into as few texts of at most max_tokens as possible.
+
+    Sentences are only split, at word boundaries, when one alone is too
+    long. Greedy packing of an ordered sequence needs the fewest chunks,
+    and no text is dropped.
+    """
+    chunks = []
+    chunk = []
+    chunk_tokens = 0
+    for sentence in sentences:
+        n_tokens = count_tokens(sentence)
+        pieces = [(sentence, n_tokens)] if n_tokens <= max_tokens else _split_words(sentence, max_tokens, count_tokens)
+        for piece, n_tokens in pieces:
+            if chunk and chunk_tokens + n_tokens > max_tokens:
+                chunks.append(''.join(chunk))
+                chunk = []
+                chunk_tokens = 0
+            chunk.append(piece)
+            chunk_tokens += n_tokens
+
+    if chunk:
+        chunks.append(''.join(chunk))
+    return chunks
+
+
+def _split_words(sentence, max_tokens, count_tokens):
+    """Splits a sentence into runs of whole words of at most max_tokens, with their token counts."""
+    pieces = []
+    words = []
+    n_tokens = 0
+    for word in sentence.split():
+        word_tokens = count_tokens(word)
+        if words and n_tokens + word_tokens > max_tokens:
+            pieces.append((' ' + ' '.join(words), n_tokens))
+            words = []
+            n_tokens = 0
+        words.append(word)
+        n_tokens += word_tokens
+
+    if words:
+        pieces.append((' ' + ' '.join(words), n_tokens))
+    return pieces
+
+
+class SummarizerEngine(object):
+    """A resident ProphetNet summarization model.
+
+    Loads the checkpoint, the translation_prophetnet task and the sequence
+    generator once, then binarizes and summarizes text entirely in memory.
+    With no model_path, builds a randomly initialised model instead, from
+    base_architecture with the attributes in architecture overridden, e.g.
+    a tiny one for benchmarks.
+    """
+
+    def __init__(self, model_path, architecture=None):
+        load_start = timer()
+
+        input_args = [prophetnet_path,
+                      '--user-dir', prophetnet_path,
+                      '--task', 'translation_prophetnet',
+                      '--source-lang', 'src',
+                      '--target-lang', 'tgt',
+                      '--batch-size', config.summarizer_batch_size,
+                      '--beam', config.beam,
+                      '--lenpen', config.lenpen]
+        if model_path is not None:
+            input_args += ['--path', model_path]
+        self.use_cuda = torch.cuda.is_available()
+        if not self.use_cuda:
+            input_args.append('--cpu')
+
+        # parse_args_and_arch imports the prophetnet user-dir, registering its task and model
+        self.args = options.parse_args_and_arch(options.get_generation_parser(), input_args=input_args)
+
+        from prophetnet.translation import TranslationProphetnetTask
+
+        self.tokenizer = tokenizer.get_tokenizer()
+        self.dictionary = self.tokenizer.dictionary
+        self.task = TranslationProphetnetTask(self.args, self.dictionary, self.dictionary)
+
+        if model_path is not None:
+            self.models, _ = checkpoint_utils.load_model_ensemble([model_path], task=self.task)
+        else:
+            model_args = copy.copy(self.args)
+            model_args.arch = 'ngram_transformer_prophet'
+            for name, value in (architecture or {}).items():
+                setattr(model_args, name, value)
+            self.models = [self.task.build_model(model_args)]
+        for model in self.models:
+            model.make_generation_fast_(beamable_mm_beam_size=self.args.beam, need_attn=False)
+            model.eval()
+            if self.use_cuda:
+                model.cuda()
+
+        self.generator = self.task.build_generator(self.args)
+        self.max_positions = utils.resolve_max_positions(
+            self.task.max_positions(), *[model.max_positions() for model in self.models])
+        # the tightest of the task's and every encoder's source limit, eos included
+        self.max_source_positions = min(
+            [self.max_positions[0]] + [model.encoder.max_positions() for model in self.models])
+
+        self.load_time = timer() - load_start
+        logging.info('Loaded summarizer model in %0.3fs.' % self.load_time)
+        metrics.model_load_seconds.labels('summarizer').set(self.load_time)
+
+        self._lock = threading.Lock()
+
+    def encode(self, input_string):
+        return self.tokenizer.encode(input_string)
+
+    def generate(self, src_tokens):
+        """Runs beam search over binarized source sentences, returning one summary per sentence."""
+        dataset = self.task.build_dataset_for_inference(src_tokens, [t.numel() for t in src_tokens])
+        itr = self.task.get_batch_iterator(
+            dataset=dataset,
+            max_tokens=self.args.max_tokens,
+            max_sentences=self.args.max_sentences,
+            max_positions=self.max_positions,
+        ).next_epoch_itr(shuffle=False)
+
+        summaries = [''] * len(src_tokens)
+        with self._lock, torch.no_grad():
+            for sample in itr:
+                if self.use_cuda:
+                    sample = utils.move_to_cuda(sample)
+                hypos = self.task.inference_step(self.generator, self.models, sample)
+                for i, sample_id in enumerate(sample['id'].tolist()):
+                    hypo_tokens = hypos[i][0]['tokens'].int().cpu()
+                    summaries[sample_id] = detokenize(self.dictionary.string(hypo_tokens))
 
+        return summaries
 
-def tokenize(input_string, output_file):
-    tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')
-    tokens = tokenizer.tokenize(input_string)
-    line = " ".join(tokens)
-    line = '{}\n'.format(line)
+    def pack(self, sentences):
+        return pack_sentences(sentences, self.max_source_positions - 1, self.tokenizer.count)  # leave room for eos
 
-    with open(output_file + ".src", 'w', encoding='utf-8') as src:
-        src.write(line)
+    def summarize(self, input_string):
+        return self.summarize_batch([input_string])[0]
 
-    with open(output_file + ".tgt", 'w', encoding='utf-8') as tgt:
-        tgt.write("line")
+    def summarize_batch(self, input_strings):
+        """Summarizes many texts in length-sorted batches through a single generation pass."""
+        return self.generate(self.tokenizer.encode_batch(input_strings))
 
 
-def summarize(input_string, request_dir, model_dir, log_stream):
-    os.makedirs(request_dir, exist_ok=True)
+class SummarizationScheduler(object):
+    """Batches summarization work from every active job through one engine.
 
-    tokenized = request_dir + "tokenized"
-    model = model_dir + config.summarizer_model
-    lenpen = config.lenpen
+    Jobs submit chunks and get back futures. A single worker thread gathers
+    queued chunks until either the padded token budget is reached or the
+    oldest chunk has waited max_wait seconds, then generates the bucket of
+    similarly sized sources that holds the oldest chunk.
+    """
 
-    tokenize(input_string, tokenized)
+    def __init__(self, engine, max_tokens, max_wait, bucket_width):
+        self.engine = engine
+        self.max_tokens = max_tokens
+        self.max_wait = max_wait
+        self.bucket_width = bucket_width
 
-    try:
-        summary = subprocess.check_output(["./summarizer.sh",
-                                           tokenized,
-                                           request_dir,
-                                           model,
-                                           lenpen,
-                                           config.preprocessworkers,
-                                           config.generateworkers,
-                                           config.beam]).decode(sys.stdout.encoding).strip()
-        summary = summary.replace('[X_SEP]', '')
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._sentences = 0
+        self._queue_wait = 0.0
+        self._max_queue_wait = 0.0
+        self._real_tokens = 0
+        self._padded_tokens = 0
 
-        with open(log_stream, 'a') as f:
-            f.write('\n' + summary + '\n')
+        self._worker = threading.Thread(target=self._run, name='summarizer', daemon=True)
+        self._worker.start()
+
+    def submit(self, input_string):
+        # tokenize on the caller's thread so only generation is serialized
+        future = Future()
+        with metrics.stage_seconds.labels('tokenize').time():
+            src_tokens = self.engine.encode(input_string)
+        self._queue.put((src_tokens, future, timer()))
+        return future
+
+    def _bucket(self, item):
+        return item[0].numel() // self.bucket_width
+
+    def _run(self):
+        pending = []
+        while True:
+            batch = []
+            try:
+                if not pending:
+                    pending.append(self._queue.get())
+
+                deadline = pending[0][2] + self.max_wait
+                while sum(item[0].numel() for item in pending) < self.max_tokens:
+                    timeout = deadline - timer()
+                    if timeout <= 0:
+                        break
+                    try:
+                        pending.append(self._queue.get(timeout=timeout))
+                    except queue.Empty:
+                        break
+
+                batch, pending = self._take_batch(pending)
+                self._generate(batch)
+            except Exception as e:
+                # fail everything in hand rather than let the worker die and leave callers waiting forever
+                logging.exception('Error scheduling summaries')
+                for _, future, _ in batch + pending:
+                    if not future.done():
+                        future.set_exception(e)
+                pending = []
+
+    def _take_batch(self, pending):
+        """Splits off the oldest item's length bucket, up to the padded token budget."""
+        buckets = collections.defaultdict(list)
+        for item in pending:
+            buckets[self._bucket(item)].append(item)
+
+        batch = []
+        max_len = 0
+        for item in buckets[self._bucket(pending[0])]:
+            item_len = item[0].numel()
+            if batch and max(max_len, item_len) * (len(batch) + 1) > self.max_tokens:
+                break
+            batch.append(item)
+            max_len = max(max_len, item_len)
+
+        taken = set(id(item) for item in batch)
+        return batch, [item for item in pending if id(item) not in taken]
+
+    def _generate(self, batch):
+        start = timer()
+        src_tokens = [item[0] for item in batch]
+        try:
+            summaries = self.engine.generate(src_tokens)
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        elapsed = timer() - start
+        metrics.stage_seconds.labels('summarize').observe(elapsed)
+        for (_, future, _), summary in zip(batch, summaries):
+            future.set_result(summary)
+
+        lengths = [t.numel() for t in src_tokens]
+        waits = [start - enqueued for _, _, enqueued in batch]
+        with self._stats_lock:
+            self._batches += 1
+            self._sentences += len(batch)
+            self._queue_wait += sum(waits)
+            self._max_queue_wait = max(self._max_queue_wait, max(waits))
+            self._real_tokens += sum(lengths)
+            self._padded_tokens += max(lengths) * len(lengths)
+
+        logging.debug('Summarized batch of %d in %0.3fs (longest wait %0.3fs, padding waste %0.2f).'
+                      % (len(batch), elapsed, max(waits), 1 - sum(lengths) / (max(lengths) * len(lengths))))
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'batches': self._batches,
+                'queued': self._queue.qsize(),
+                'mean_batch_size': self._sentences / self._batches if self._batches else 0.0,
+                'mean_queue_wait': self._queue_wait / self._sentences if self._sentences else 0.0,
+                'max_queue_wait': self._max_queue_wait,
+                'padding_waste': 1 - self._real_tokens / self._padded_tokens if self._padded_tokens else 0.0,
+            }
+
+
+_engine = None
+_engine_lock = threading.Lock()
+_scheduler = None
+
+
+def get_engine(model_dir):
+    """Returns the process-wide summarizer engine, loading it on first use."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = SummarizerEngine(model_dir + config.summarizer_model)
+    return _engine
+
+
+def get_scheduler(model_dir):
+    """Returns the process-wide scheduler that batches summarization across jobs."""
+    global _scheduler
+    engine = get_engine(model_dir)
+    with _engine_lock:
+        if _scheduler is None:
+            _scheduler = SummarizationScheduler(engine,
+                                                config.summarizer_max_batch_tokens,
+                                                config.summarizer_max_wait,
+                                                config.summarizer_bucket_width)
+            metrics.register_stats('podcast_summarizer', 'Summarization scheduler', _scheduler.stats, ('batches',))
+    return _scheduler
+
+
+def pack(sentences, model_dir):
+    """Packs consecutive sentences into as few summarizer inputs as fit the encoder."""
+    return get_engine(model_dir).pack(sentences)
+
+
+def submit_batch(input_strings, model_dir):
+    """Queues texts with the shared scheduler, returning one future per text."""
+    scheduler = get_scheduler(model_dir)
+    return [scheduler.submit(input_string) for input_string in input_strings]
+
+
+def collect(futures):
+    """Waits for summaries from submit_batch, in submission order."""
+    summaries = []
+    for future in futures:
+        try:
+            summary = future.result()
+        except Exception:
+            logging.exception('Error summarizing')
+            summary = ''
         logging.debug('Summary: ' + summary)
+        summaries.append(summary)
+
+    return summaries
 
-        return summary
-    except subprocess.CalledProcessError as e:
-        logging.error("exit: " + str(e.returncode) + " output: " + str(e.output))
@@ -0,0 +1,89 @@
+import functools
+import os
+import threading
+
+import torch
+from pytorch_transformers.tokenization_bert import BasicTokenizer
+
+import config
+from prophetnet.bert_dictionary import BertDictionary
+
+vocab_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'prophetnet', 'vocab.txt')
+
+
+class Tokenizer(object):
+    """An uncased BERT WordPiece tokenizer that emits BertDictionary ids directly.
+
+    Produces the same tokens as BertTokenizer.from_pretrained('bert-base-uncased')
+    followed by fairseq-preprocess, but loads the vocab once and memoizes the
+    WordPiece split of each distinct word in a bounded LRU cache.
+    """
+
+    special_tokens = ['[UNK]', '[SEP]', '[PAD]', '[CLS]', '[MASK]']
+
+    def __init__(self, vocab, cache_size, max_input_chars_per_word=100):
+        self.dictionary = BertDictionary.load_from_file(vocab)
+        self.basic_tokenizer = BasicTokenizer(do_lower_case=True, never_split=self.special_tokens)
+        self.max_input_chars_per_word = max_input_chars_per_word
+        self.wordpiece = functools.lru_cache(maxsize=cache_size)(self._wordpiece)
+
+    def _wordpiece(self, word):
+        """Greedy longest-match-first split of one word, as a tuple of (piece, id) pairs."""
+        indices = self.dictionary.indices
+        unk = ((self.dictionary.unk_word, self.dictionary.unk_index),)
+        if len(word) > self.max_input_chars_per_word:
+            return unk
+
+        pieces = []
+        start = 0
+        while start < len(word):
+            end = len(word)
+            while start < end:
+                piece = word[start:end]
+                if start > 0:
+                    piece = '##' + piece
+                if piece in indices:
+                    pieces.append((piece, indices[piece]))
+                    break
+                end -= 1
+            if start == end:
+                return unk
+            start = end
+
+        return tuple(pieces)
+
+    def words(self, text):
+        return self.basic_tokenizer.tokenize(text, never_split=self.special_tokens)
+
+    def tokenize(self, text):
+        """Returns the WordPiece strings for text."""
+        return [piece for word in self.words(text) for piece, _ in self.wordpiece(word)]
+
+    def count(self, text):
+        """Returns the number of WordPiece tokens in text, not counting eos."""
+        return sum(len(self.wordpiece(word)) for word in self.words(text))
+
+    def encode(self, text):
+        """Returns text as a LongTensor of dictionary ids, terminated by eos."""
+        ids = [index for word in self.words(text) for _, index in self.wordpiece(word)]
+        ids.append(self.dictionary.eos())
+        return torch.tensor(ids, dtype=torch.long)
+
+    def encode_batch(self, texts):
+        return [self.encode(text) for text in texts]
+
+    def cache_info(self):
+        return self.wordpiece.cache_info()
+
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer():
+    """Returns the process-wide tokenizer, loading the vocab on first use."""
+    global _tokenizer
+    with _tokenizer_lock:
+        if _tokenizer is None:
+            _tokenizer = Tokenizer(vocab_path, config.tokenizer_cache_size)
+    return _tokenizer
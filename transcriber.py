@@ -6,11 +6,17 @@ import numpy as np
 import glob
 import webrtcvad
 import collections
+import multiprocessing
+import queue
+import threading
 import time
 from deepspeech import Model
 from timeit import default_timer as timer
 
+import artifacts
 import config
+import helpers
+import metrics
 
 
 def read_wave(wf):
@@ -43,12 +49,19 @@ def write_wave(path, audio, sample_rate):
 
 
 class Frame(object):
-    """Represents a "frame" of audio data."""
+    """Represents a "frame" of audio data.
 
-    def __init__(self, bytedata, timestamp, duration):
+    bytes is a zero-copy view into the PCM buffer and offset is the
+    position of the frame's first byte within the whole audio stream.
+    """
+
+    __slots__ = ('bytes', 'timestamp', 'duration', 'offset')
+
+    def __init__(self, bytedata, timestamp, duration, offset=0):
         self.bytes = bytedata
         self.timestamp = timestamp
         self.duration = duration
+        self.offset = offset
 
 
 def frame_generator(frame_duration_ms, audio, sample_rate):
@@ -59,16 +72,216 @@ def frame_generator(frame_duration_ms, audio, sample_rate):
 
     Yields Frames of the requested duration.
     """
+    audio = memoryview(audio)
     n = int(sample_rate * (frame_duration_ms / 1000.0) * 2)
     offset = 0
     timestamp = 0.0
     duration = (float(n) / sample_rate) / 2.0
     while offset + n < len(audio):
-        yield Frame(audio[offset:offset + n], timestamp, duration)
+        yield Frame(audio[offset:offset + n], timestamp, duration, offset)
         timestamp += duration
         offset += n
 
 
+class StreamingAudio(object):
+    """PCM audio arriving as a stream of blocks.
+
+    Blocks are kept only until the VAD segments that need them have been
+    cut, so memory holds the audio since the last segment rather than the
+    whole stream. Consumers that only need the frames themselves can turn
+    retention off.
+    """
+
+    def __init__(self, blocks, frame_duration_ms, sample_rate, retain=True):
+        self.blocks = iter(blocks)
+        self.frame_size = int(sample_rate * (frame_duration_ms / 1000.0) * 2)
+        self.frame_duration = (float(self.frame_size) / sample_rate) / 2.0
+        self.retain = retain
+        self.offset = 0
+        self._pending = b''
+        self._retained = collections.deque()
+
+    def _next_block(self):
+        """Pulls the next block, trimmed to a whole number of frames, or None at the end of the stream.
+
+        Frames that straddle two blocks are reassembled, so blocks may be
+        of any size.
+        """
+        for block in self.blocks:
+            if self._pending:
+                block = self._pending + block
+            usable = len(block) - len(block) % self.frame_size
+            self._pending = block[usable:]
+            if not usable:
+                continue
+
+            offset = self.offset
+            view = memoryview(block)[:usable]
+            if self.retain:
+                self._retained.append((offset, view))
+            self.offset += usable
+            return offset, view
+
+        return None
+
+    def frames(self):
+        """Generates audio frames as soon as their audio arrives."""
+        n = self.frame_size
+        timestamp = 0.0
+        while True:
+            block = self._next_block()
+            if block is None:
+                return
+            offset, view = block
+            for local in range(0, len(view), n):
+                yield Frame(view[local:local + n], timestamp, self.frame_duration, offset + local)
+                timestamp += self.frame_duration
+
+    def read(self, start, end):
+        """Returns the audio between two stream offsets, without copying if it lies in one block."""
+        pieces = []
+        for block_start, block in self._retained:
+            block_end = block_start + len(block)
+            if block_end <= start:
+                continue
+            if block_start >= end:
+                break
+            pieces.append(block[max(start - block_start, 0):end - block_start])
+        return pieces[0] if len(pieces) == 1 else b''.join(pieces)
+
+    def release(self, offset):
+        """Drops blocks that lie entirely before offset."""
+        while self._retained and self._retained[0][0] + len(self._retained[0][1]) <= offset:
+            self._retained.popleft()
+
+    def segments(self, ranges):
+        """Yields (audio, timestamp) for each (start, end, timestamp) range.
+
+        Ranges may come from a vad_collector running over frames() or be
+        known in advance, in which case blocks are pulled as needed.
+        """
+        for start, end, timestamp in ranges:
+            while self.offset < end and self._next_block() is not None:
+                pass
+            segment = self.read(start, end)
+            self.release(end)
+            yield segment, timestamp
+
+        # consume the rest of the stream so its producer runs to completion
+        while self._next_block() is not None:
+            self.release(self.offset)
+
+
+class SlicedAudio(object):
+    """An audio file decoded as time slices in parallel and VAD-labelled serially.
+
+    Each slice is decoded by its own ffmpeg, seeked to the slice start, in
+    a worker process that writes the PCM into pcm_path at the slice's
+    offset. Workers start decoding warmup_seconds before their slice so
+    the decoder has settled by the slice start. As each slice lands, in
+    order, its frames are labelled by a single webrtcvad instance and run
+    through the serial state machine (voiced_ranges), so labels and
+    segments are exactly those of a serial pass over the same PCM; the
+    adaptive noise model has no state that a per-slice pass could match.
+    webrtcvad runs far faster than real time, so decoding stays the part
+    worth spreading across cores.
+    """
+
+    def __init__(self, audio_path, pcm_path, pool, aggressiveness, slice_seconds, warmup_seconds,
+                 frame_duration_ms=30, sample_rate=16000):
+        self.audio_path = audio_path
+        self.pcm_path = pcm_path
+        self.vad = webrtcvad.Vad(int(aggressiveness))
+        self.sample_rate = sample_rate
+        self.frame_duration_ms = frame_duration_ms
+        self.frame_size = int(sample_rate * (frame_duration_ms / 1000.0) * 2)
+        self.frame_duration = (float(self.frame_size) / sample_rate) / 2.0
+        self.available = 0
+        self.length = None
+        self.decode_time = 0.0
+
+        frames_per_slice = max(int(slice_seconds * 1000 / frame_duration_ms), 1)
+        warmup_frames = int(warmup_seconds * 1000 / frame_duration_ms)
+        self.duration = helpers.probe_duration(audio_path)
+        total_frames = int(self.duration * 1000 / frame_duration_ms)
+        starts = list(range(0, max(total_frames, 1), frames_per_slice))
+
+        with open(pcm_path, 'wb'):
+            pass
+
+        # the last slice runs to the end of the file, whatever the duration estimate said
+        self._slices = collections.deque()
+        for i, start_frame in enumerate(starts):
+            n_frames = frames_per_slice if i < len(starts) - 1 else None
+            result = pool.apply_async(_decode_slice, (audio_path, pcm_path, start_frame, n_frames, warmup_frames,
+                                                      frame_duration_ms, sample_rate))
+            self._slices.append((start_frame * self.frame_size, n_frames, result))
+        logging.info('Decoding %s as %d slices' % (audio_path, len(starts)))
+
+    def _next_slice(self):
+        """Waits for the next slice in order; returns its (offset, bytes written) or None after the last one."""
+        if self.length is not None or not self._slices:
+            return None
+
+        offset, n_frames, result = self._slices.popleft()
+        n_bytes, decode_time = result.get()
+        self.available = offset + n_bytes
+        self.decode_time += decode_time
+
+        if n_frames is None or n_bytes < n_frames * self.frame_size:
+            self.length = self.available
+            # slices past the end of the audio may still write a little; drop it once they're done
+            while self._slices:
+                self._slices.popleft()[2].wait()
+            os.truncate(self.pcm_path, self.length)
+            # worker seconds summed over the slices, not wall time
+            metrics.stage_seconds.labels('convert').observe(self.decode_time)
+
+        return offset, n_bytes
+
+    def labelled_frames(self):
+        """Yields (offset, timestamp, is_speech) for every frame, labelling each slice as it lands."""
+        n = self.frame_size
+        timestamp = 0.0
+        vad_time = 0.0
+        with open(self.pcm_path, 'rb') as f:
+            while True:
+                decoded_slice = self._next_slice()
+                if decoded_slice is None:
+                    break
+                offset, n_bytes = decoded_slice
+                pcm = memoryview(os.pread(f.fileno(), n_bytes, offset))
+                # a serial pass never labels a final frame that ends exactly at the end of the audio
+                end = len(pcm) - n + 1
+                if self.length is not None and len(pcm) % n == 0:
+                    end -= n
+                for local in range(0, max(end, 0), n):
+                    start = timer()
+                    is_speech = self.vad.is_speech(pcm[local:local + n], self.sample_rate)
+                    vad_time += timer() - start
+                    yield offset + local, timestamp, is_speech
+                    timestamp += self.frame_duration
+        metrics.stage_seconds.labels('vad').observe(vad_time)
+
+    def segments(self, ranges):
+        """Yields (audio, timestamp) for each (start, end, timestamp) range once its slices are decoded."""
+        fd = os.open(self.pcm_path, os.O_RDONLY)
+        try:
+            for start, end, timestamp in ranges:
+                while self.available < end and self._next_slice() is not None:
+                    pass
+                yield os.pread(fd, end - start, start), timestamp
+        finally:
+            os.close(fd)
+
+        # wait for the remaining slices so the PCM file is complete
+        while self._next_slice() is not None:
+            pass
+
+    def hexdigest(self):
+        return artifacts.hash_pcm(self.pcm_path) if self.length is not None else None
+
+
 def vad_collector(sample_rate, frame_duration_ms, padding_duration_ms, vad, frames):
     """Filters out non-voiced audio frames.
 
@@ -93,58 +306,75 @@ def vad_collector(sample_rate, frame_duration_ms, padding_duration_ms, vad, fram
     vad - An instance of webrtcvad.Vad.
     frames - a source of audio frames (sequence or generator).
 
-    Returns: A generator that yields PCM audio data.
+    Returns: A generator that yields (start offset, end offset, timestamp)
+    for each voiced segment. Voiced frames are always contiguous, so a
+    segment is just the byte range from its first frame to its last.
     """
+    frame_size = int(sample_rate * (frame_duration_ms / 1000.0) * 2)
     num_padding_frames = int(padding_duration_ms / frame_duration_ms)
-    # We use a deque for our sliding window/ring buffer.
+
+    return voiced_ranges(frame_size, num_padding_frames, label_frames(vad, frames, sample_rate))
+
+
+def label_frames(vad, frames, sample_rate):
+    """Yields (offset, timestamp, is_speech) per frame, recording the time spent in the VAD once frames run out."""
+    elapsed = 0.0
+    for frame in frames:
+        start = timer()
+        is_speech = vad.is_speech(frame.bytes, sample_rate)
+        elapsed += timer() - start
+        yield frame.offset, frame.timestamp, is_speech
+    metrics.stage_seconds.labels('vad').observe(elapsed)
+
+
+def voiced_ranges(frame_size, num_padding_frames, labelled_frames):
+    """The state machine behind vad_collector, over (offset, timestamp, is_speech) per frame.
+
+    Lets frames be labelled elsewhere, e.g. slice by slice by SlicedAudio.
+    """
+    # We use a deque of (offset, timestamp, is_speech) for our sliding
+    # window/ring buffer, keeping a running count of its voiced frames.
     ring_buffer = collections.deque(maxlen=num_padding_frames)
+    num_voiced = 0
     # We have two states: TRIGGERED and NOTTRIGGERED. We start in the
     # NOTTRIGGERED state.
     triggered = False
 
-    voiced_frames = []
-    for frame in frames:
-        is_speech = vad.is_speech(frame.bytes, sample_rate)
+    start = end = start_timestamp = None
+    for offset, timestamp, is_speech in labelled_frames:
+        if len(ring_buffer) == ring_buffer.maxlen:
+            num_voiced -= ring_buffer[0][2]
+        ring_buffer.append((offset, timestamp, is_speech))
+        num_voiced += is_speech
 
         if not triggered:
-            ring_buffer.append((frame, is_speech))
-            num_voiced = len([f for f, speech in ring_buffer if speech])
-
             # If we're NOTTRIGGERED and more than 90% of the frames in
             # the ring buffer are voiced frames, then enter the
-            # TRIGGERED state.
+            # TRIGGERED state. The segment starts with the audio that's
+            # already in the ring buffer.
             if num_voiced > 0.9 * ring_buffer.maxlen:
                 triggered = True
-
-                # We want to yield all the audio we see from now until
-                # we are NOTTRIGGERED, but we have to start with the
-                # audio that's already in the ring buffer.
-                for f, s in ring_buffer:
-                    voiced_frames.append(f)
+                start, start_timestamp = ring_buffer[0][0], ring_buffer[0][1]
+                end = offset + frame_size
                 ring_buffer.clear()
+                num_voiced = 0
         else:
-            # We're in the TRIGGERED state, so collect the audio data
-            # and add it to the ring buffer.
-            voiced_frames.append(frame)
-            ring_buffer.append((frame, is_speech))
-            num_unvoiced = len([f for f, speech in ring_buffer if not speech])
+            # We're in the TRIGGERED state, so extend the segment to the
+            # end of this frame.
+            end = offset + frame_size
 
             # If more than 90% of the frames in the ring buffer are
-            # unvoiced, then enter NOTTRIGGERED and yield whatever
-            # audio we've collected.
-            if num_unvoiced > 0.9 * ring_buffer.maxlen:
+            # unvoiced, then enter NOTTRIGGERED and yield the segment.
+            if len(ring_buffer) - num_voiced > 0.9 * ring_buffer.maxlen:
                 triggered = False
-                yield b''.join([f.bytes for f in voiced_frames]), voiced_frames[0].timestamp
+                yield start, end, start_timestamp
                 ring_buffer.clear()
-                voiced_frames = []
-
-    if triggered:
-        pass
+                num_voiced = 0
 
-    # If we have any leftover voiced audio when we run out of input,
+    # If we're still in a voiced segment when we run out of input,
     # yield it.
-    if voiced_frames:
-        yield b''.join([f.bytes for f in voiced_frames]), voiced_frames[0].timestamp
+    if triggered:
+        yield start, end, start_timestamp
 
 
 '''
@@ -162,15 +392,80 @@ def load_model(models, scorer):
     ds = Model(models)
     model_load_end = timer() - model_load_start
     logging.debug("Loaded model in %0.3fs." % model_load_end)
+    metrics.model_load_seconds.labels('deepspeech').set(model_load_end)
 
     scorer_load_start = timer()
     ds.enableExternalScorer(scorer)
     scorer_load_end = timer() - scorer_load_start
     logging.debug('Loaded external scorer in %0.3fs.' % scorer_load_end)
+    metrics.model_load_seconds.labels('scorer').set(scorer_load_end)
 
     return [ds, model_load_end, scorer_load_end]
 
 
+class ModelPool(object):
+    """A fixed set of DeepSpeech models shared by every request in the process.
+
+    Models are loaded once up front; request threads check one out for the
+    duration of a transcription and block while all of them are in use.
+    """
+
+    def __init__(self, model_dir, size):
+        output_graph, scorer = resolve_models(os.path.expanduser(model_dir))
+
+        self.size = size
+        self.load_time = 0.0
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self._models = queue.Queue()
+        self._stats_lock = threading.Lock()
+        for _ in range(size):
+            ds, model_load_time, scorer_load_time = load_model(output_graph, scorer)
+            self.load_time += model_load_time + scorer_load_time
+            self._models.put(ds)
+
+        logging.info('Loaded %d DeepSpeech model(s) in %0.3fs.' % (size, self.load_time))
+
+    @contextlib.contextmanager
+    def model(self):
+        wait_start = timer()
+        ds = self._models.get()
+        wait_time = timer() - wait_start
+        with self._stats_lock:
+            self.checkouts += 1
+            self.wait_seconds += wait_time
+        logging.debug('Checked out DeepSpeech model after %0.3fs, %d/%d in use.'
+                      % (wait_time, self.in_use(), self.size))
+        try:
+            yield ds
+        finally:
+            self._models.put(ds)
+            logging.debug('Returned DeepSpeech model, %d/%d in use.' % (self.in_use(), self.size))
+
+    def in_use(self):
+        return self.size - self._models.qsize()
+
+    def stats(self):
+        with self._stats_lock:
+            return {'size': self.size, 'in_use': self.in_use(), 'load_time': self.load_time,
+                    'checkouts': self.checkouts, 'wait_seconds': self.wait_seconds}
+
+
+_model_pool = None
+_model_pool_lock = threading.Lock()
+
+
+def get_model_pool(model_dir):
+    """Returns the process-wide model pool, loading it on first use."""
+    global _model_pool
+    with _model_pool_lock:
+        if _model_pool is None:
+            _model_pool = ModelPool(model_dir, config.deepspeech_pool_size)
+            metrics.register_stats('podcast_model_pool', 'DeepSpeech model pool', _model_pool.stats,
+                                   ('checkouts', 'wait_seconds'))
+    return _model_pool
+
+
 '''
 Run Inference on input audio file
 @param ds: Deepspeech object
@@ -223,51 +518,279 @@ Generate VAD segments. Filters out non-voiced audio frames.
 
 @Retval:
 Returns tuple of
-    segments: a byte array of multiple smaller audio frames
-              (The longer audio split into multiple smaller one's)
+    segments: a generator of (audio, timestamp), where audio is a zero-copy
+              view of one voiced stretch of the input
     sample_rate: Sample rate of the input audio file
     audio_length: Duration of the input audio file
 
 '''
 
 
-def vad_segment_generator(wav_data, aggressiveness):
+def vad_segment_generator(wav_data, aggressiveness, ranges=None, on_range=None):
     audio, sample_rate, audio_length = read_wave(wav_data)
     assert sample_rate == 16000, "Only 16000Hz input WAV files are supported for now!"
-    vad = webrtcvad.Vad(int(aggressiveness))
-    frames = frame_generator(30, audio, sample_rate)
-    frames = list(frames)
-    segment_generator = vad_collector(sample_rate, 30, 300, vad, frames)
+    audio = memoryview(audio)
+    if ranges is None:
+        vad = webrtcvad.Vad(int(aggressiveness))
+        frames = frame_generator(30, audio, sample_rate)
+        ranges = vad_collector(sample_rate, 30, 300, vad, frames)
+    if on_range is not None:
+        ranges = observe(ranges, on_range)
+    segment_generator = ((audio[start:end], timestamp) for start, end, timestamp in ranges)
 
     return segment_generator, sample_rate, audio_length
 
 
-def transcribe(wavfile_path, model_dir, log_stream):
-    dir_name = os.path.expanduser(model_dir)
+'''
+Generate VAD segments from a stream of PCM blocks as they arrive.
+@param blocks: Iterable of 16kHz 16-bit mono PCM blocks
+@param aggressiveness: webrtcvad aggressiveness, 0-3
+
+@Retval:
+Returns tuple of
+    segments: a generator of voiced audio segments
+    sample_rate: Sample rate of the stream
+'''
+
+
+def vad_stream_segment_generator(blocks, aggressiveness, sample_rate=16000, ranges=None, on_range=None):
+    audio = StreamingAudio(blocks, 30, sample_rate)
+    if ranges is None:
+        vad = webrtcvad.Vad(int(aggressiveness))
+        ranges = vad_collector(sample_rate, 30, 300, vad, audio.frames())
+    if on_range is not None:
+        ranges = observe(ranges, on_range)
+    segment_generator = audio.segments(ranges)
 
-    output_graph, scorer = resolve_models(dir_name)
+    return segment_generator, sample_rate
 
-    deepspeech_object, model_load_time, scorer_load_time = load_model(output_graph, scorer)
 
+def observe(items, callback):
+    for item in items:
+        callback(item)
+        yield item
+
+
+def transcribe(wavfile_path, model_dir, log_stream, ranges=None, on_range=None, on_duration=None):
+    """Transcribes a wav file. Precomputed VAD ranges skip the VAD pass; on_range sees each range used.
+
+    on_duration is given the length of the audio in seconds once it is read.
+    """
     with contextlib.closing(wave.open(wavfile_path, 'rb')) as wav_data:
-        segment_generator, sample_rate, audio_length = vad_segment_generator(wav_data, config.aggressiveness)
+        segment_generator, sample_rate, audio_length = vad_segment_generator(
+            wav_data, config.aggressiveness, ranges, on_range)
+    if on_duration is not None:
+        on_duration(audio_length)
 
-    sentences = []
+    return transcribe_segments(segment_generator, sample_rate, model_dir, log_stream)
 
-    for i, (segment, timestamp) in enumerate(segment_generator):
-        with open(log_stream, 'a') as f:
-            f.write("\nProcessing chunk %002d\n" % (i,))
-        logging.info("Processing chunk %002d" % (i,))
 
-        segment = np.frombuffer(segment, dtype=np.int16)
-        inference, time_taken, segment_length = stt(deepspeech_object, segment, sample_rate)
+def transcribe_stream(pcm_blocks, model_dir, log_stream, ranges=None, on_range=None):
+    """Transcribes a PCM stream. Precomputed VAD ranges skip the VAD pass; on_range sees each range used."""
+    segment_generator, sample_rate = vad_stream_segment_generator(
+        pcm_blocks, config.aggressiveness, ranges=ranges, on_range=on_range)
+
+    return transcribe_segments(segment_generator, sample_rate, model_dir, log_stream)
 
-        with open(log_stream, 'a') as f:
-            tmp_timestamp = time.strftime('%H:%M:%S', time.gmtime(timestamp))
-            f.write('\nTranscription @ ' + str(tmp_timestamp) + '\n')
-            f.write('\n' + inference + '\n')
+
+def transcribe_sliced(audio, model_dir, log_stream, ranges=None, on_range=None):
+    """Transcribes a SlicedAudio. Precomputed VAD ranges skip the VAD pass; on_range sees each range used."""
+    if ranges is None:
+        num_padding_frames = int(300 / audio.frame_duration_ms)
+        ranges = voiced_ranges(audio.frame_size, num_padding_frames, audio.labelled_frames())
+    if on_range is not None:
+        ranges = observe(ranges, on_range)
+
+    return transcribe_segments(audio.segments(ranges), audio.sample_rate, model_dir, log_stream)
+
+
+def transcribe_live(pcm_blocks, model_dir, log_stream, sample_rate=16000):
+    """Transcribes a live broadcast, yielding (timestamp, sentence) as each utterance ends.
+
+    Holds only the VAD window and the open DeepSpeech stream in memory.
+    """
+    vad = webrtcvad.Vad(int(config.aggressiveness))
+    frames = StreamingAudio(pcm_blocks, 30, sample_rate, retain=False).frames()
+
+    with get_model_pool(model_dir).model() as deepspeech_object:
+        results = streaming_stt(deepspeech_object, sample_rate, 30, 300, vad, frames)
+        for sentence in report_transcriptions(results, log_stream):
+            yield sentence
+
+
+def streaming_stt(ds, sample_rate, frame_duration_ms, padding_duration_ms, vad, frames):
+    """Feeds voiced frames into DeepSpeech's streaming API as they arrive.
+
+    Uses the same padded sliding window as vad_collector, but instead of
+    cutting segments it opens a DeepSpeech stream when the window triggers,
+    feeds it every frame until the window de-triggers, and then yields
+    (timestamp, sentence) from finishStream.
+    """
+    num_padding_frames = int(padding_duration_ms / frame_duration_ms)
+    ring_buffer = collections.deque(maxlen=num_padding_frames)
+    num_voiced = 0
+    stream = None
+    timestamp = None
+
+    for frame in frames:
+        is_speech = vad.is_speech(frame.bytes, sample_rate)
+
+        if len(ring_buffer) == ring_buffer.maxlen:
+            num_voiced -= ring_buffer[0][1]
+        ring_buffer.append((frame, is_speech))
+        num_voiced += is_speech
+
+        if stream is None:
+            if num_voiced > 0.9 * ring_buffer.maxlen:
+                stream = ds.createStream()
+                timestamp = ring_buffer[0][0].timestamp
+                for f, _ in ring_buffer:
+                    stream.feedAudioContent(np.frombuffer(f.bytes, dtype=np.int16))
+                ring_buffer.clear()
+                num_voiced = 0
+        else:
+            stream.feedAudioContent(np.frombuffer(frame.bytes, dtype=np.int16))
+
+            if len(ring_buffer) - num_voiced > 0.9 * ring_buffer.maxlen:
+                yield timestamp, stream.finishStream()
+                stream = None
+                ring_buffer.clear()
+                num_voiced = 0
+
+    if stream is not None:
+        yield timestamp, stream.finishStream()
+
+
+def transcribe_segments(segment_generator, sample_rate, model_dir, log_stream):
+    """Yields (timestamp, sentence) for each voiced segment as soon as it is transcribed."""
+    if config.stt_workers > 1:
+        results = parallel_stt(segment_generator, sample_rate, model_dir)
+    else:
+        results = pooled_stt(segment_generator, sample_rate, model_dir)
+
+    return report_transcriptions(results, log_stream)
+
+
+def report_transcriptions(results, log_stream):
+    """Streams progress for each (timestamp, sentence) and passes it on."""
+    for i, (timestamp, inference) in enumerate(results):
+        log_stream.write("\nProcessing chunk %002d\n" % (i,))
+        logging.info("Processing chunk %002d" % (i,))
+
+        tmp_timestamp = time.strftime('%H:%M:%S', time.gmtime(timestamp))
+        log_stream.write('\nTranscription @ ' + str(tmp_timestamp) + '\n')
+        log_stream.write('\n' + inference + '\n')
         logging.debug((timestamp, inference))
 
-        sentences.append((timestamp, inference))
+        yield timestamp, inference
 
-    return sentences
+
+def pooled_stt(segment_generator, sample_rate, model_dir):
+    """Transcribes segments one at a time on a model checked out of the shared pool."""
+    with get_model_pool(model_dir).model() as deepspeech_object:
+        for segment, timestamp in segment_generator:
+            segment = np.frombuffer(segment, dtype=np.int16)
+            inference, time_taken, segment_length = stt(deepspeech_object, segment, sample_rate)
+            metrics.observe_stt(time_taken, segment_length)
+
+            yield timestamp, inference
+
+
+_worker_model = None
+
+
+def _init_stt_worker(model_dir):
+    global _worker_model
+    output_graph, scorer = resolve_models(os.path.expanduser(model_dir))
+    _worker_model = load_model(output_graph, scorer)[0]
+
+
+def _stt_worker(segment, timestamp, sample_rate):
+    segment = np.frombuffer(segment, dtype=np.int16)
+    inference, time_taken, segment_length = stt(_worker_model, segment, sample_rate)
+    return timestamp, inference, os.getpid(), time_taken, segment_length
+
+
+_stt_process_pool = None
+
+
+def get_stt_process_pool(model_dir):
+    """Returns the process-wide pool of STT workers, each holding its own Model."""
+    global _stt_process_pool
+    with _model_pool_lock:
+        if _stt_process_pool is None:
+            _stt_process_pool = multiprocessing.Pool(config.stt_workers, _init_stt_worker, (model_dir,))
+    return _stt_process_pool
+
+
+def parallel_stt(segment_generator, sample_rate, model_dir):
+    """Fans segments out to the STT worker processes.
+
+    Keeps at most two segments per worker in flight and yields results in
+    timestamp order as they complete. Logs the real-time factor of each
+    worker once the segments run out.
+    """
+    pool = get_stt_process_pool(model_dir)
+    in_flight = collections.deque()
+    worker_stats = collections.defaultdict(lambda: [0.0, 0.0])
+
+    def collect():
+        timestamp, inference, pid, time_taken, segment_length = in_flight.popleft().get()
+        worker_stats[pid][0] += time_taken
+        worker_stats[pid][1] += segment_length
+        metrics.observe_stt(time_taken, segment_length)
+        return timestamp, inference
+
+    for segment, timestamp in segment_generator:
+        in_flight.append(pool.apply_async(_stt_worker, (bytes(segment), timestamp, sample_rate)))
+        if len(in_flight) >= 2 * config.stt_workers:
+            yield collect()
+
+    while in_flight:
+        yield collect()
+
+    for pid, (inference_time, audio_time) in sorted(worker_stats.items()):
+        logging.info('STT worker %d: %0.3fs of audio in %0.3fs, real-time factor %0.3f.'
+                     % (pid, audio_time, inference_time, inference_time / audio_time if audio_time else 0.0))
+
+
+def _decode_slice(audio_path, pcm_path, start_frame, n_frames, warmup_frames, frame_duration_ms, sample_rate):
+    """Decodes one slice of audio into pcm_path.
+
+    Returns (bytes written, decode seconds). n_frames of None decodes to
+    the end of the file.
+    """
+    frame_size = int(sample_rate * (frame_duration_ms / 1000.0) * 2)
+    seek_frame = max(start_frame - warmup_frames, 0)
+    skip = (start_frame - seek_frame) * frame_size
+    limit = None if n_frames is None else skip + n_frames * frame_size
+
+    decode_start = timer()
+    pcm = bytearray()
+    for block in helpers.decode_pcm(audio_path, sample_rate, config.pcm_block_size,
+                                    seek_frame * frame_duration_ms / 1000.0):
+        pcm += block
+        if limit is not None and len(pcm) >= limit:
+            break
+    pcm = memoryview(pcm)[:limit]
+    decode_time = timer() - decode_start
+
+    fd = os.open(pcm_path, os.O_WRONLY)
+    try:
+        os.pwrite(fd, pcm[skip:], start_frame * frame_size)
+    finally:
+        os.close(fd)
+
+    return max(len(pcm) - skip, 0), decode_time
+
+
+_decode_pool = None
+
+
+def get_decode_pool():
+    """Returns the process-wide pool of workers that decode time slices."""
+    global _decode_pool
+    with _model_pool_lock:
+        if _decode_pool is None:
+            _decode_pool = multiprocessing.Pool(config.decode_workers)
+    return _decode_pool